@@ -0,0 +1,227 @@
+"""
+Native PDF markup annotations.
+
+In 'annotations' markup mode the generators do not draw comments and shapes
+into the page content. Each markup instead becomes a real /Annot object that
+Bluebeam and other viewers list as a markup:
+
+  FreeText   comment text, optionally with a callout line (IT FreeTextCallout)
+  Square     box
+  Circle     circle / ellipse
+  Polygon    revision cloud (BE cloud border effect)
+  Ink        freehand pen strokes
+  PolyLine   length measurement (IT PolyLineDimension, shared /Measure)
+
+Generators collect Annotation records per page (coordinates in PDF user
+space, origin bottom-left) and add_annotations() writes them all at once:
+every annotation and its appearance stream is a new object written directly
+with PyMuPDF's low-level object API, and each page's /Annots array is set a
+single time. Nothing is re-parsed or re-scanned per annotation, so the cost
+stays linear in the number of annotations (100k per document is fine).
+"""
+
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+MARKUP_MODES = ('drawn', 'annotations')
+
+# subtype: PDF annotation subtype; rect: (x0, y0, x1, y1); entries: extra
+# dictionary entries; content: appearance stream operators; font/measure: the
+# appearance uses the shared font / the dictionary refers to the shared /Measure
+Annotation = namedtuple('Annotation', 'subtype rect entries content font measure')
+
+FONT_NAME = 'Helv'
+_FONT_OBJECT = '<</Type/Font/Subtype/Type1/BaseFont/Helvetica/Encoding/WinAnsiEncoding>>'
+# One point per unit, shown in inches
+_MEASURE_OBJECT = ('<</Type/Measure/Subtype/RL/R(1 in = 1 in)'
+                   '/X[<</Type/NumberFormat/U(in)/C 0.0138889/D 100>>]'
+                   '/D[<</Type/NumberFormat/U(in)/C 1/D 100>>]'
+                   '/A[<</Type/NumberFormat/U(sq in)/C 1/D 100>>]>>')
+_KAPPA = 0.5523  # cubic Bezier control distance for a quarter circle
+
+
+def _n(v):
+    return f'{v:.2f}'.rstrip('0').rstrip('.')
+
+
+def _color(rgb):
+    return ' '.join(_n(c) for c in rgb)
+
+
+def _text(s):
+    # Literal string for an appearance stream drawn with the WinAnsi Helvetica
+    s = s.encode('cp1252', 'replace').decode('latin-1')
+    return '(' + s.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _bounds(points, pad):
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    return min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+
+
+def _ellipse_ops(x0, y0, x1, y1):
+    cx, cy, rx, ry = (x0 + x1) / 2, (y0 + y1) / 2, (x1 - x0) / 2, (y1 - y0) / 2
+    kx, ky = rx * _KAPPA, ry * _KAPPA
+    return (f'{_n(cx + rx)} {_n(cy)} m '
+            f'{_n(cx + rx)} {_n(cy + ky)} {_n(cx + kx)} {_n(cy + ry)} {_n(cx)} {_n(cy + ry)} c '
+            f'{_n(cx - kx)} {_n(cy + ry)} {_n(cx - rx)} {_n(cy + ky)} {_n(cx - rx)} {_n(cy)} c '
+            f'{_n(cx - rx)} {_n(cy - ky)} {_n(cx - kx)} {_n(cy - ry)} {_n(cx)} {_n(cy - ry)} c '
+            f'{_n(cx + kx)} {_n(cy - ry)} {_n(cx + rx)} {_n(cy - ky)} {_n(cx + rx)} {_n(cy)} c')
+
+
+def _text_ops(lines, x, top, font_size, line_height):
+    if not lines:
+        return ''
+    y = top - font_size
+    ops = [f'BT /{FONT_NAME} {_n(font_size)} Tf 0 g {_n(line_height)} TL {_n(x)} {_n(y)} Td']
+    ops.extend(f'{_text(ln)} Tj T*' for ln in lines)
+    ops.append('ET')
+    return ' '.join(ops)
+
+
+def free_text(rect, text, lines=None, color=(0, 0, 0), border=True, callout=None,
+              font_size=10, line_height=None):
+    """Comment box. lines are the wrapped lines shown in the appearance (default:
+    text as one line); callout is an (x, y) point the box points at."""
+    x0, y0, x1, y1 = rect
+    line_height = line_height or font_size * 1.2
+    lines = [text] if lines is None else lines
+    width = 1 if border else 0
+    ops = []
+    if border:
+        ops.append(f'{width} w {_color(color)} RG 1 g {_n(x0)} {_n(y0)} {_n(x1 - x0)} {_n(y1 - y0)} re B')
+    pad = 5 if border else 0
+    ops.append(_text_ops(lines, x0 + pad, y1 - pad, font_size, line_height))
+    entries = [f'/Contents{fitz.get_pdf_str(text)}', f'/DA(/{FONT_NAME} {_n(font_size)} Tf 0 g)',
+               f'/C[{_color(color)}]', f'/BS<</W {width}>>']
+    outer = rect
+    if callout is not None:
+        # Line from the middle of the box to the target, ending in a diamond
+        ex, ey = callout
+        sx, sy = (x0 + x1) / 2, (y0 + y1) / 2
+        d = 4
+        ops.insert(0, f'1 w {_color(color)} RG 1 g {_n(sx)} {_n(sy)} m {_n(ex)} {_n(ey)} l S '
+                      f'{_n(ex)} {_n(ey + d)} m {_n(ex + d)} {_n(ey)} l {_n(ex)} {_n(ey - d)} l '
+                      f'{_n(ex - d)} {_n(ey)} l h B')
+        outer = (min(x0, ex - d - 1), min(y0, ey - d - 1), max(x1, ex + d + 1), max(y1, ey + d + 1))
+        entries += ['/IT/FreeTextCallout', f'/CL[{_n(ex)} {_n(ey)} {_n(sx)} {_n(sy)}]', '/LE/Diamond',
+                    f'/RD[{_n(x0 - outer[0])} {_n(y0 - outer[1])} {_n(outer[2] - x1)} {_n(outer[3] - y1)}]']
+    return Annotation('FreeText', outer, ''.join(entries), ' '.join(ops), True, False)
+
+
+def square(rect, color, width=1.5, contents=None):
+    x0, y0, x1, y1 = rect
+    h = width / 2
+    ops = f'{_n(width)} w {_color(color)} RG {_n(x0 + h)} {_n(y0 + h)} {_n(x1 - x0 - width)} {_n(y1 - y0 - width)} re S'
+    entries = f'/C[{_color(color)}]/BS<</W {_n(width)}>>'
+    if contents:
+        entries += f'/Contents{fitz.get_pdf_str(contents)}'
+    return Annotation('Square', rect, entries, ops, False, False)
+
+
+def circle(rect, color, width=1.5, contents=None):
+    x0, y0, x1, y1 = rect
+    h = width / 2
+    ops = f'{_n(width)} w {_color(color)} RG 1 g {_ellipse_ops(x0 + h, y0 + h, x1 - h, y1 - h)} B'
+    entries = f'/C[{_color(color)}]/IC[1 1 1]/BS<</W {_n(width)}>>'
+    if contents:
+        entries += f'/Contents{fitz.get_pdf_str(contents)}'
+    return Annotation('Circle', rect, entries, ops, False, False)
+
+
+def cloud(rect, color, width=1, radius=6, contents=None):
+    """Revision cloud around rect: a Polygon with the cloudy border effect."""
+    x0, y0, x1, y1 = rect
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    ops = [f'{_n(width)} w {_color(color)} RG {_n(x0)} {_n(y0)} m']
+    for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+        dx, dy = bx - ax, by - ay
+        length = (dx * dx + dy * dy) ** 0.5
+        bumps = max(1, round(length / (2 * radius)))
+        # Each bump is a half circle bulging outwards (to the right of the edge)
+        nx, ny = dy / length * radius * 4 / 3, -dx / length * radius * 4 / 3
+        for i in range(bumps):
+            px, py = ax + dx * i / bumps, ay + dy * i / bumps
+            qx, qy = ax + dx * (i + 1) / bumps, ay + dy * (i + 1) / bumps
+            ops.append(f'{_n(px + nx)} {_n(py + ny)} {_n(qx + nx)} {_n(qy + ny)} {_n(qx)} {_n(qy)} c')
+    ops.append('h S')
+    vertices = ' '.join(f'{_n(x)} {_n(y)}' for x, y in corners)
+    entries = f'/Vertices[{vertices}]/C[{_color(color)}]/BS<</W {_n(width)}>>/BE<</S/C/I 1>>'
+    if contents:
+        entries += f'/Contents{fitz.get_pdf_str(contents)}'
+    return Annotation('Polygon', _bounds(corners, radius + width), entries, ' '.join(ops), False, False)
+
+
+def ink(strokes, color, width=1, contents=None):
+    """Freehand pen markup; strokes is a list of point lists."""
+    ops = [f'{_n(width)} w 1 J 1 j {_color(color)} RG']
+    ink_list = []
+    for points in strokes:
+        ops.append(f'{_n(points[0][0])} {_n(points[0][1])} m')
+        ops.extend(f'{_n(x)} {_n(y)} l' for x, y in points[1:])
+        ops.append('S')
+        ink_list.append('[' + ' '.join(f'{_n(x)} {_n(y)}' for x, y in points) + ']')
+    entries = f'/InkList[{"".join(ink_list)}]/C[{_color(color)}]/BS<</W {_n(width)}>>'
+    if contents:
+        entries += f'/Contents{fitz.get_pdf_str(contents)}'
+    points = [p for stroke in strokes for p in stroke]
+    return Annotation('Ink', _bounds(points, width), entries, ' '.join(ops), False, False)
+
+
+def measurement(p1, p2, text, color, width=0.5, font_size=8):
+    """Length measurement between two points, labelled with text (e.g. '4.2 in')."""
+    (x1, y1), (x2, y2) = p1, p2
+    m = 5  # end marker half size
+    ops = [f'{_n(width)} w {_color(color)} RG {_n(x1)} {_n(y1)} m {_n(x2)} {_n(y2)} l']
+    for x, y in p1, p2:
+        ops.append(f'{_n(x - m)} {_n(y - m)} m {_n(x + m)} {_n(y + m)} l '
+                   f'{_n(x - m)} {_n(y + m)} m {_n(x + m)} {_n(y - m)} l')
+    ops.append('S')
+    # Label centred above the midpoint (Helvetica is about 0.5 em per character)
+    label_w = len(text) * font_size * 0.5
+    lx, ly = (x1 + x2) / 2 - label_w / 2, (y1 + y2) / 2 + 10
+    ops.append(f'BT /{FONT_NAME} {_n(font_size)} Tf {_color(color)} rg {_n(lx)} {_n(ly)} Td {_text(text)} Tj ET')
+    x0, y0, xe, ye = _bounds([p1, p2], m + width)
+    rect = (min(x0, lx), y0, max(xe, lx + label_w), max(ye, ly + font_size + 2))
+    entries = (f'/Vertices[{_n(x1)} {_n(y1)} {_n(x2)} {_n(y2)}]/IT/PolyLineDimension'
+               f'/Contents{fitz.get_pdf_str(text)}/C[{_color(color)}]/BS<</W {_n(width)}>>')
+    return Annotation('PolyLine', rect, entries, ' '.join(ops), True, True)
+
+
+def add_annotations(doc, page_annotations, compress=True):
+    """Write Annotation records into doc. page_annotations maps a page index to a
+    list of Annotations; every page's /Annots array is written once (annotations
+    already on the page are kept). Returns the number of annotations added."""
+    font_xref = measure_xref = None
+    added = 0
+    for page_index, annotations in page_annotations.items():
+        if not annotations:
+            continue
+        page_xref = doc.page_xref(page_index)
+        refs = []
+        for a in annotations:
+            if a.font and font_xref is None:
+                font_xref = doc.get_new_xref()
+                doc.update_object(font_xref, _FONT_OBJECT)
+            if a.measure and measure_xref is None:
+                measure_xref = doc.get_new_xref()
+                doc.update_object(measure_xref, _MEASURE_OBJECT)
+            rect = ' '.join(_n(v) for v in a.rect)
+            resources = f'/Resources<</Font<</{FONT_NAME} {font_xref} 0 R>>>>' if a.font else ''
+            ap_xref = doc.get_new_xref()
+            doc.update_object(ap_xref, f'<</Type/XObject/Subtype/Form/BBox[{rect}]{resources}>>')
+            doc.update_stream(ap_xref, a.content.encode('latin-1'), compress=compress)
+            measure = f'/Measure {measure_xref} 0 R' if a.measure else ''
+            annot_xref = doc.get_new_xref()
+            doc.update_object(annot_xref, f'<</Type/Annot/Subtype/{a.subtype}/Rect[{rect}]/F 4'
+                                          f'/P {page_xref} 0 R/AP<</N {ap_xref} 0 R>>{a.entries}{measure}>>')
+            refs.append(f'{annot_xref} 0 R')
+        kind, value = doc.xref_get_key(page_xref, 'Annots')
+        if kind == 'xref':
+            value = doc.xref_object(int(value.split()[0]), compressed=True)
+            kind = 'array'
+        existing = value.strip()[1:-1].strip() if kind == 'array' else ''
+        doc.xref_set_key(page_xref, 'Annots', '[' + ' '.join(filter(None, [existing, *refs])) + ']')
+        added += len(refs)
+    return added
@@ -4,210 +4,383 @@ import tempfile
 import fitz  # PyMuPDF
 from fpdf import FPDF
 from datetime import datetime
-from flask import Flask, render_template, request, send_file, send_from_directory, jsonify, redirect, url_for, make_response
+from flask import Flask, render_template, request, send_file, send_from_directory, jsonify, redirect, url_for, make_response, Response
 import io
+import json
 import base64
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from PyPDF2 import PdfMerger, PdfReader, PdfWriter
+from PyPDF2 import PdfMerger
 import shutil
+from padding import padding_needed
+from filler import PAD_MODES, fill_file, iter_filled
+from comments import COMMENT_FILE_TYPES, iter_comments, iter_text_lines
+from compression import (COMPRESSION_MODES, compression_level, fitz_deflate, fpdf_compress,
+                         reportlab_page_compression)
+from rendering import (DEFAULT_RENDER, IMAGE_FORMATS, RENDER_COLORSPACES, PageBackgrounds, RenderSettings,
+                       document_digest, file_digest)
+from cache import LRUCache
+from pdf_metadata import pdf_date, set_pdf_metadata
+from page_selection import page_plan, parse_spec
+from placement import PlacementGrid
+from geometry import cloud_paths, measurement_segments, polyline_paths
+from content_writer import ContentWriter
+from annotations import MARKUP_MODES, add_annotations, circle, cloud, free_text, ink, measurement, square
+from text_wrap import wrap_text
+from jobs import JobManager, JobRejected
+from profiling import NULL_RECORDER, SpanRecorder
+from template_store import TemplateStore
+from batch import iter_batch, iter_zip
+from parallel import map_pages, new_seed, page_rng, resolve_workers, split_pages
+
+BACKGROUND_MODES = ('raster', 'vector')
+
+def stamp_overlay(doc, overlay_bytes, plan, stamped_pages, page_size, recorder=NULL_RECORDER,
+                  reproducible=False, deflate=False, annotations=None, compress_annotations=True):
+    """Build the output from the original source pages with the overlay stamped on top.
+    plan gives the source page index of every output page (see page_selection.page_plan).
+    The first use of a source page copies it as-is (vector content, text layer and
+    annotations are kept); later uses show that page as a shared form XObject, so
+    its content is stored once. None entries are blank pages of page_size. Only pages
+    listed in stamped_pages get the overlay page of the same index drawn over them.
+    reproducible leaves out the random document ID, so equal input gives equal bytes;
+    deflate compresses any uncompressed streams when saving. annotations (page index ->
+    list of annotations.Annotation) are added as native annotation objects, with their
+    appearance streams compressed if compress_annotations."""
+    out = fitz.open()
+    copied = set()
+    with recorder.span('copy_pages'):
+        start = 0
+        while start < len(plan):
+            src = plan[start]
+            if src is None:
+                out.new_page(width=page_size[0], height=page_size[1])
+            elif src in copied:
+                rect = doc.load_page(src).rect
+                page = out.new_page(width=rect.width, height=rect.height)
+                page.show_pdf_page(page.rect, doc, src)
+            else:
+                # Copy a run of consecutive first-use pages in one call; final=0 keeps
+                # the object map, so resources shared between runs are copied once
+                end = start
+                while (end + 1 < len(plan) and plan[end + 1] == plan[end] + 1
+                       and plan[end + 1] not in copied):
+                    end += 1
+                out.insert_pdf(doc, from_page=src, to_page=plan[end], final=0)
+                copied.update(plan[start:end + 1])
+                start = end
+            start += 1
+    if stamped_pages:
+        with recorder.span('stamp'):
+            overlay = fitz.open('pdf', overlay_bytes)
+            for page_num in sorted(stamped_pages):
+                page = out.load_page(page_num)
+                page.show_pdf_page(page.rect, overlay, page_num)
+            overlay.close()
+    if annotations:
+        with recorder.span('annotate'):
+            add_annotations(out, annotations, compress=compress_annotations)
+    with recorder.span('save'):
+        return out.tobytes(no_new_id=reproducible, deflate=deflate)
+
+MAX_UNPLACED_REPORTED = 1000  # (page, text) samples kept in stats['unplaced']
 
 def generate_pdf_with_markdown(pdf_path, markdown_content, page_count=None,
-                               text_enabled=True, shapes_enabled=False, shape_types=None):
+                               text_enabled=True, shapes_enabled=False, shape_types=None,
+                               background='raster', stats=None, progress=None,
+                               recorder=NULL_RECORDER, seed=None, timestamp=None,
+                               compression='default', markup_mode='drawn', pages=None,
+                               render_settings=DEFAULT_RENDER):
     """Generate a PDF by overlaying bubble comments onto the PDF background.
     Each non-empty line of the provided markdown_content becomes a separate
     comment bubble with a leader line (callout) pointing to a random spot.
-    Only include the requested number of pages."""
+    markdown_content may also be any iterable of comment strings (see
+    comments.iter_comments); it is consumed lazily, one comment at a time.
+
+    pages is a page selection spec (see page_selection, e.g. "1-10" or "random:5");
+    only the selected source pages are loaded. page_count defaults to the number of
+    selected pages; a larger count repeats the selection, and a repeated page reuses
+    the first copy's image (raster) or page XObject (vector) instead of rendering it again.
+
+    background='raster' renders each source page to an image and draws the
+    comments over it; background='vector' keeps the original page objects and
+    stamps only the comment/shape overlay on top, so the cost depends on the
+    number of annotations rather than on page pixel area. render_settings
+    (rendering.RenderSettings) set the raster background's resolution, colour
+    space and encoding.
+
+    If a stats dict is passed, stats['unplaced_count'] is set to the number of
+    comments that could not be placed without overlapping others and
+    stats['unplaced'] to the (page, text) of the first MAX_UNPLACED_REPORTED.
+    progress, if given, is called as progress(pages_done, page_count) as pages
+    are produced.
+    recorder (a profiling.SpanRecorder) collects per-stage timings when profiling.
+
+    seed makes the output reproducible: comment assignment uses a private RNG
+    seeded with it and each page draws from its own (seed, page) RNG. timestamp
+    (a datetime) fixes the creation date instead of using the current time.
+    compression is one of compression.COMPRESSION_MODES.
+
+    markup_mode='annotations' emits comments and shapes as native /Annot objects
+    (FreeText, Square, Polygon cloud, Ink) instead of drawing them into the page."""
+    if background not in BACKGROUND_MODES:
+        raise ValueError(f"Unknown background mode: {background}")
+    if markup_mode not in MARKUP_MODES:
+        raise ValueError(f"Unknown markup mode: {markup_mode}")
+    annotate = markup_mode == 'annotations'
     try:
-        # Create a temporary directory for images
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Open the PDF
-            doc = fitz.open(pdf_path)
+        # Open the PDF
+        with recorder.span('open'):
+            # pdf_path may also be an already open document (a warm template handle)
+            doc = pdf_path if isinstance(pdf_path, fitz.Document) else fitz.open(pdf_path)
             total_pages = len(doc)
-            if page_count is not None:
-                page_count = int(page_count)
-            else:
-                page_count = total_pages
-            
-            # Create a new PDF (use points so coordinates match background image size)
-            pdf = FPDF(unit='pt')
+            # Content digest of the source, used as the rendered-page cache key
+            digest = document_digest(doc) if background == 'raster' else None
+        if page_count is not None:
+            page_count = int(page_count)
+        
+        # Create a new PDF (use points so coordinates match background image size)
+        pdf = FPDF(unit='pt')
+        pdf.set_compression(fpdf_compress(compression))
+        if timestamp is not None:
+            pdf.set_creation_date(timestamp)
+        if seed is None:
+            seed = new_seed()
+        rng = random.Random(seed)
+        # Source page index of every output page
+        plan = page_plan(total_pages, page_count, pages, seed)
+        page_count = len(plan)
 
-            # Prepare comments once and distribute across pages
-            all_comments = []
-            if markdown_content:
-                all_comments = [ln.strip() for ln in markdown_content.split('\n') if ln.strip()]
-            
-            # We will distribute comments randomly across the requested pages
-            comments_by_page = {}
-            # We'll fill this after we know page_count (computed just below)
-            # Determine the default page size (from first page of PDF or fallback)
-            if total_pages > 0:
-                first_page = doc.load_page(0)
-                default_width, default_height = first_page.rect.width, first_page.rect.height
-                width_pt = default_width * 72 / 72
-                height_pt = default_height * 72 / 72
-            else:
-                width_pt, height_pt = 612, 792  # 8.5x11" default
-
-            # Initialize page assignment map now that we know the page_count
-            comments_by_page = {i: [] for i in range(page_count)}
-            for txt in all_comments:
-                assigned = random.randint(0, max(0, page_count - 1))
-                comments_by_page[assigned].append(txt)
-
-            # Simple helper to wrap text and get height for a given width
-            def wrap_lines(pdf_obj, text, max_width, line_height):
-                words = text.split(' ')
-                lines = []
-                cur = ''
-                for word in words:
-                    candidate = (cur + ' ' + word).strip()
-                    if pdf_obj.get_string_width(candidate) <= max_width:
-                        cur = candidate
-                    else:
-                        if cur:
-                            lines.append(cur)
-                        cur = word
-                if cur:
-                    lines.append(cur)
-                return lines
-
-            # Normalize shape types
-            if not shape_types:
-                shape_types = []
-            allowed_shapes = {'box', 'cloud', 'pen'}
-            shape_types = [s for s in shape_types if s in allowed_shapes]
-            if shapes_enabled and not shape_types:
-                shape_types = ['box']
-
-            for page_num in range(page_count):
-                if page_num < total_pages:
-                    page = doc.load_page(page_num)
-                    width, height = page.rect.width, page.rect.height
-                    width_pt = width * 72 / 72
-                    height_pt = height * 72 / 72
-                    pdf.add_page(format=(width_pt, height_pt))
-                    img_path = os.path.join(temp_dir, f'page_{page_num}.png')
-                    pix = page.get_pixmap()
-                    pix.save(img_path)
-                    pdf.image(img_path, x=0, y=0, w=width_pt, h=height_pt)
+        # Determine the default page size (from first selected page or fallback)
+        if plan and plan[0] is not None:
+            first_page = doc.load_page(plan[0])
+            default_width, default_height = first_page.rect.width, first_page.rect.height
+            width_pt = default_width * 72 / 72
+            height_pt = default_height * 72 / 72
+        else:
+            width_pt, height_pt = 612, 792  # 8.5x11" default
+
+        # Pages that receive overlay content (only these are stamped in vector mode)
+        stamped_pages = set()
+        # Native annotations per page index (markup_mode='annotations')
+        page_annotations = {}
+        # Comments that could not be placed without overlapping: a count plus the
+        # first few (page_num, text) so a huge input cannot grow this without bound
+        unplaced = []
+        unplaced_count = 0
+
+        # Normalize shape types
+        if not shape_types:
+            shape_types = []
+        allowed_shapes = {'box', 'cloud', 'pen'}
+        shape_types = [s for s in shape_types if s in allowed_shapes]
+        if shapes_enabled and not shape_types:
+            shape_types = ['box']
+
+        # Add every page (with its background) first; comments are then streamed
+        # onto pages as they arrive, so they never all have to be held in memory
+        page_state = []
+        page_sizes = {}  # source page index -> (width, height)
+        if background == 'raster':
+            backgrounds = PageBackgrounds(doc, [src for src in plan if src is not None], digest,
+                                          render_settings)
+        for page_num, src in enumerate(plan):
+            if progress is not None:
+                progress(page_num, page_count)
+            if src is not None:
+                repeat = src in page_sizes
+                if not repeat:
+                    page = doc.load_page(src)
+                    page_sizes[src] = page.rect.width, page.rect.height
+                width, height = page_sizes[src]
+                width_pt = width * 72 / 72
+                height_pt = height * 72 / 72
+                pdf.add_page(format=(width_pt, height_pt))
+                # Layout (top-left) to PDF coordinates for annotations; vector output
+                # keeps the first copy of a source page, with its own mediabox and rotation
+                # (repeats are new pages showing it, see stamp_overlay)
+                if background == 'vector' and not repeat:
+                    to_pdf = ~page.transformation_matrix
                 else:
-                    pdf.add_page(format=(width_pt, height_pt))
-                # Overlay bubble comment callouts randomly on this page
-                page_comments = comments_by_page.get(page_num, [])
-                if not page_comments:
-                    continue
-                
-                # Styling and layout constraints
-                pdf.set_font('Arial', '', 12)
-                margin = 36  # 0.5 inch
-                line_height = 16
-                min_w, max_w = 180, 300
-                placed_boxes = []  # track placed rects (x, y, w, h) to avoid overlaps
-
-                def overlaps(r1, r2):
-                    x1, y1, w1, h1 = r1
-                    x2, y2, w2, h2 = r2
-                    return not (x1 + w1 <= x2 or x2 + w2 <= x1 or y1 + h1 <= y2 or y2 + h2 <= y1)
-
-                def draw_shape_with_optional_text(text, shape_kind, idx=0):
-                    # choose a random box width for shapes/text area
-                    w = random.uniform(min_w, min(max_w, max(120, width_pt - 2 * margin)))
-                    # Estimate height based on text if text_enabled
-                    inner_w = w - 12
-                    lines = wrap_lines(pdf, text, inner_w, line_height) if (text_enabled and text) else []
-                    text_h = (12 + len(lines) * line_height) if lines else 0
-                    base_h = max(36, text_h or 48)
-
-                    # Try to find a non-overlapping random position
-                    for _ in range(25):
-                        x = random.uniform(margin, max(margin, width_pt - margin - w))
-                        y = random.uniform(margin, max(margin, height_pt - margin - base_h))
-                        candidate = (x, y, w, base_h)
-                        if all(not overlaps(candidate, pb) for pb in placed_boxes):
-                            pdf.set_draw_color(30, 144, 255)
-                            pdf.set_fill_color(255, 255, 255)
-                            if shapes_enabled:
-                                if shape_kind == 'box':
-                                    # outline box
-                                    pdf.rect(x, y, w, base_h, style='D')
-                                elif shape_kind == 'cloud':
-                                    # crude cloud effect: small circles around the boundary
-                                    bumps = max(8, int(w / 30))
-                                    r = 8
-                                    step = (w - 2*r) / bumps
-                                    cx = x + r
-                                    top = y
-                                    bottom = y + base_h
-                                    # top edge bumps
-                                    for i in range(bumps):
-                                        pdf.ellipse(cx + i*step - r/2, top - r/2, r, r)
-                                    # bottom edge bumps
-                                    for i in range(bumps):
-                                        pdf.ellipse(cx + i*step - r/2, bottom - r/2, r, r)
-                                    # left/right edges bumps
-                                    vbumps = max(4, int(base_h / 24))
-                                    vstep = (base_h - 2*r) / vbumps
-                                    cy = y + r
-                                    for i in range(vbumps):
-                                        pdf.ellipse(x - r/2, cy + i*vstep - r/2, r, r)
-                                        pdf.ellipse(x + w - r/2, cy + i*vstep - r/2, r, r)
-                                elif shape_kind == 'pen':
-                                    # simple freehand polyline within area
-                                    px = x + 6
-                                    py = y + base_h/2
-                                    segments = max(5, int(w / 40))
-                                    for i in range(segments):
-                                        nx = min(x + w - 6, px + random.uniform(15, 30))
-                                        ny = min(max(y + 6, py + random.uniform(-20, 20)), y + base_h - 6)
-                                        pdf.line(px, py, nx, ny)
-                                        px, py = nx, ny
-                            # draw text if requested
-                            if text_enabled and lines:
-                                pdf.set_text_color(0, 0, 0)
-                                pdf.set_xy(x + 6, y + 6)
-                                for ln in lines:
-                                    pdf.cell(inner_w, line_height, ln, ln=1)
-                            placed_boxes.append(candidate)
-                            return True
-                    return False
-
-                def draw_text_only(text):
-                    # Choose area width for wrapping text, but render without any box or leader
-                    w = random.uniform(min_w, min(max_w, max(120, width_pt - 2 * margin)))
-                    inner_w = w
-                    lines = wrap_lines(pdf, text, inner_w, line_height)
-                    h = len(lines) * line_height
-                    for _ in range(25):
-                        x = random.uniform(margin, max(margin, width_pt - margin - w))
-                        y = random.uniform(margin, max(margin, height_pt - margin - h))
-                        candidate = (x, y, w, h)
-                        if all(not overlaps(candidate, pb) for pb in placed_boxes):
-                            pdf.set_text_color(0, 0, 0)
-                            pdf.set_xy(x, y)
-                            for ln in lines:
-                                pdf.cell(inner_w, line_height, ln, ln=1)
-                            placed_boxes.append(candidate)
-                            return True
-                    return False
-
-                shape_idx = 0
-                for text in page_comments:
-                    if shapes_enabled:
-                        kind = shape_types[shape_idx % len(shape_types)] if shape_types else 'box'
-                        draw_shape_with_optional_text(text, kind, shape_idx)
-                        shape_idx += 1
-                    elif text_enabled:
-                        draw_text_only(text)
-            
-            # Save the PDF to a bytes buffer
+                    to_pdf = fitz.Matrix(1, 0, 0, -1, 0, height_pt)
+                if background == 'raster':
+                    # Pixmap samples go to FPDF in memory, no PNG round-trip on disk
+                    with compression_level(compression):
+                        backgrounds.draw(pdf, src, width_pt, height_pt, recorder=recorder)
+            else:
+                pdf.add_page(format=(width_pt, height_pt))
+                to_pdf = fitz.Matrix(1, 0, 0, -1, 0, height_pt)
+            page_state.append({'width': width_pt, 'height': height_pt, 'grid': None, 'writer': None,
+                               'rand': page_rng(seed, page_num), 'shape_idx': 0, 'clouds': [], 'pens': [],
+                               'to_pdf': to_pdf, 'annots': page_annotations.setdefault(page_num, []) if annotate else None})
+        if background == 'raster':
+            backgrounds.close()
+
+        # Styling and layout constraints
+        pdf.set_auto_page_break(False)  # overlays never flow onto new pages
+        pdf.set_font('Arial', '', 12)
+        margin = 36  # 0.5 inch
+        line_height = 16
+        min_w, max_w = 180, 300
+        markup_color = (30 / 255, 144 / 255, 1)
+        font_id, font_size = pdf.current_font.i, pdf.font_size_pt
+
+        def new_writer(state):
+            # Overlay operators go straight into a per-page buffer (see content_writer);
+            # they are appended to the FPDF page once all comments are placed
+            writer = ContentWriter(state['height'], encoding=pdf.core_fonts_encoding)
+            writer.line_width(pdf.line_width * pdf.k)
+            writer.font(font_id, font_size)
+            writer.fill_color(0, 0, 0)
+            return writer
+
+        def pen_points(x, y, w, base_h, page_rand):
+            # simple freehand polyline within area
+            px = x + 6
+            py = y + base_h/2
+            points = [(px, py)]
+            segments = max(5, int(w / 40))
+            for i in range(segments):
+                nx = min(x + w - 6, px + page_rand.uniform(15, 30))
+                ny = min(max(y + 6, py + page_rand.uniform(-20, 20)), y + base_h - 6)
+                points.append((nx, ny))
+                px, py = nx, ny
+            return points
+
+        def annotate_text(state, x, y, w, lines, text):
+            rect = fitz.Rect(x, y, x + w, y + len(lines) * line_height) * state['to_pdf']
+            state['annots'].append(free_text(tuple(rect), text, lines, border=False,
+                                             font_size=12, line_height=line_height))
+
+        def draw_shape_with_optional_text(state, text, shape_kind, idx=0):
+            width_pt, page_rand, grid = state['width'], state['rand'], state['grid']
+            # choose a random box width for shapes/text area
+            w = page_rand.uniform(min_w, min(max_w, max(120, width_pt - 2 * margin)))
+            # Estimate height based on text if text_enabled
+            inner_w = w - 12
+            lines = wrap_text(pdf, text, inner_w) if (text_enabled and text) else []
+            text_h = (12 + len(lines) * line_height) if lines else 0
+            base_h = max(36, text_h or 48)
+
+            # Find a non-overlapping position (random tries, then a packing scan)
+            pos = grid.place(w, base_h, rng=page_rand)
+            if pos is None:
+                return False
+            x, y = pos
+            if annotate:
+                to_pdf = state['to_pdf']
+                rect = tuple(fitz.Rect(x, y, x + w, y + base_h) * to_pdf)
+                if shapes_enabled:
+                    if shape_kind == 'box':
+                        state['annots'].append(square(rect, markup_color, width=1))
+                    elif shape_kind == 'cloud':
+                        state['annots'].append(cloud(rect, markup_color))
+                    elif shape_kind == 'pen':
+                        points = [tuple(fitz.Point(p) * to_pdf) for p in pen_points(x, y, w, base_h, page_rand)]
+                        state['annots'].append(ink([points], markup_color))
+                if text_enabled and lines:
+                    annotate_text(state, x + 6, y + 6, inner_w, lines, text)
+                return True
+            writer = state['writer']
+            if shapes_enabled:
+                if shape_kind == 'box':
+                    # outline box
+                    writer.stroke_color(30, 144, 255)
+                    writer.rect(x, y, w, base_h)
+                elif shape_kind == 'cloud':
+                    # crude cloud effect: small circles around the boundary, drawn
+                    # with the page's other clouds in draw_batched_shapes()
+                    state['clouds'].append((x, y, w, base_h))
+                elif shape_kind == 'pen':
+                    state['pens'].append(pen_points(x, y, w, base_h, page_rand))
+            # draw text if requested
+            if text_enabled and lines:
+                writer.text_lines(x + 6, y + 6, lines, line_height, font_size, pdf.c_margin)
+            return True
+
+        def draw_text_only(state, text):
+            width_pt, page_rand, grid = state['width'], state['rand'], state['grid']
+            # Choose area width for wrapping text, but render without any box or leader
+            w = page_rand.uniform(min_w, min(max_w, max(120, width_pt - 2 * margin)))
+            inner_w = w
+            lines = wrap_text(pdf, text, inner_w)
+            h = len(lines) * line_height
+            pos = grid.place(w, h, rng=page_rand)
+            if pos is None:
+                return False
+            x, y = pos
+            if annotate:
+                annotate_text(state, x, y, inner_w, lines, text)
+                return True
+            state['writer'].text_lines(x, y, lines, line_height, font_size, pdf.c_margin)
+            return True
+
+        def finish_page(page_num, state):
+            # All clouds and pen strokes of a page in one NumPy pass, one path each,
+            # then the page's overlay operators are appended to its content stream
+            writer = state['writer']
+            if writer is None:
+                return
+            paths = cloud_paths(state['clouds'], state['height']) + polyline_paths(state['pens'], state['height'])
+            state['clouds'], state['pens'] = [], []
+            if paths:
+                writer.stroke_color(30, 144, 255)
+                writer.path('\n'.join(paths))
+            writer.write_to(pdf, page_num + 1)
+            state['writer'] = None
+
+        # Overlay bubble comment callouts, each on a randomly chosen page
+        comments = iter_text_lines(markdown_content) if isinstance(markdown_content, str) else markdown_content
+        with recorder.span('overlay'):
+            for text in comments or ():
+                page_num = rng.randint(0, max(0, page_count - 1))
+                state = page_state[page_num]
+                if state['grid'] is None:
+                    # Spatial index of placed rects (x, y, w, h) to avoid overlaps
+                    state['grid'] = PlacementGrid(state['width'], state['height'], margin)
+                    if not annotate:
+                        stamped_pages.add(page_num)
+                        state['writer'] = new_writer(state)
+                placed = True
+                if shapes_enabled:
+                    kind = shape_types[state['shape_idx'] % len(shape_types)] if shape_types else 'box'
+                    placed = draw_shape_with_optional_text(state, text, kind, state['shape_idx'])
+                    state['shape_idx'] += 1
+                elif text_enabled:
+                    placed = draw_text_only(state, text)
+                if not placed:
+                    unplaced_count += 1
+                    if len(unplaced) < MAX_UNPLACED_REPORTED:
+                        unplaced.append((page_num, text))
+            for page_num, state in enumerate(page_state):
+                finish_page(page_num, state)
+
+        if progress is not None:
+            progress(page_count, page_count)
+        if unplaced_count:
+            print(f"Warning: {unplaced_count} comment(s) did not fit on their page and were skipped")
+        if stats is not None:
+            stats['unplaced'] = unplaced
+            stats['unplaced_count'] = unplaced_count
+        
+        # Save the PDF to a bytes buffer
+        with recorder.span('output'), compression_level(compression):
             pdf_bytes = pdf.output(dest='S')
-            if isinstance(pdf_bytes, str):
-                return pdf_bytes.encode('latin-1')
-            return bytes(pdf_bytes)
-            
+        if isinstance(pdf_bytes, str):
+            pdf_bytes = pdf_bytes.encode('latin-1')
+        if background == 'vector':
+            return stamp_overlay(doc, bytes(pdf_bytes), plan, stamped_pages, (width_pt, height_pt),
+                                 recorder=recorder, reproducible=timestamp is not None,
+                                 deflate=fitz_deflate(compression), annotations=page_annotations,
+                                 compress_annotations=compression != 'none')
+        if annotate:
+            with recorder.span('annotate'), fitz.open('pdf', bytes(pdf_bytes)) as out:
+                add_annotations(out, page_annotations, compress=compression != 'none')
+                pdf_bytes = out.tobytes(no_new_id=timestamp is not None, deflate=fitz_deflate(compression))
+        return bytes(pdf_bytes)
+        
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
         raise
@@ -215,10 +388,46 @@ def generate_pdf_with_markdown(pdf_path, markdown_content, page_count=None,
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['TEMP_FOLDER'] = tempfile.gettempdir()
+# Per-stage timings (Server-Timing header + PROFILE log line) for every request;
+# single requests can opt in with profile=true or an X-Profile header instead
+app.config['PROFILING'] = os.environ.get('PDFGEN_PROFILE', '').lower() in ('1', 'true')
+app.config['PROFILE_MEMORY'] = True  # include tracemalloc peaks in profiled spans
+
+# Background generation jobs (/jobs): worker threads, max queued+running jobs
+# overall, and max active jobs per client
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_MAX_PENDING'] = 16
+app.config['JOB_MAX_PER_CLIENT'] = 2
+
+# Batch generation (/batch): worker processes per batch and max variants per request
+app.config['BATCH_WORKERS'] = 2
+app.config['BATCH_MAX_VARIANTS'] = 500
+
+# Output of seeded (deterministic) requests is cached by (source hash, options)
+app.config['RESPONSE_CACHE_MB'] = 256
+
+# Uploaded templates (/templates) are kept here by content hash; the parsed
+# documents of the most recently used ones stay open between requests
+app.config['TEMPLATE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'templates')
+app.config['TEMPLATE_MAX_OPEN'] = 8
+
+# Pages of the default PDF rendered into the page cache by warm_up() (wsgi.py
+# runs it once in the server's master process, before workers are forked)
+app.config['WARM_PAGES'] = int(os.environ.get('PDFGEN_WARM_PAGES', '50'))
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+response_cache = LRUCache(app.config['RESPONSE_CACHE_MB'] * 1024 * 1024)
+template_store = TemplateStore(app.config['TEMPLATE_FOLDER'], max_open=app.config['TEMPLATE_MAX_OPEN'])
+
+job_manager = JobManager(
+    workers=app.config['JOB_WORKERS'],
+    max_pending=app.config['JOB_MAX_PENDING'],
+    max_per_client=app.config['JOB_MAX_PER_CLIENT'],
+)
+
 def generate_sample_markdown():
     """Generate sample markdown content for demonstration."""
     titles = [
@@ -298,18 +507,18 @@ def draw_text(c, x, y, text, font_size=10, color=colors.black):
     c.setFont("Helvetica", font_size)
     c.drawString(x, y, text)
 
-def draw_measurement(c, x1, y1, x2, y2, text, color=colors.black):
-    # Draw line
+def draw_measurement(c, x1, y1, x2, y2, text, color=colors.black, segments=None):
+    # Line and end markers as one path; segments may be precomputed for the whole
+    # page with geometry.measurement_segments()
+    if segments is None:
+        segments = measurement_segments([(x1, y1, x2, y2)])[0]
     c.setStrokeColor(color)
     c.setLineWidth(0.5)
-    c.line(x1, y1, x2, y2)
-    
-    # Draw end markers
-    marker_size = 5
-    c.line(x1 - marker_size, y1 - marker_size, x1 + marker_size, y1 + marker_size)
-    c.line(x1 - marker_size, y1 + marker_size, x1 + marker_size, y1 - marker_size)
-    c.line(x2 - marker_size, y2 - marker_size, x2 + marker_size, y2 + marker_size)
-    c.line(x2 - marker_size, y2 + marker_size, x2 + marker_size, y2 - marker_size)
+    p = c.beginPath()
+    for sx, sy, ex, ey in segments.tolist():
+        p.moveTo(sx, sy)
+        p.lineTo(ex, ey)
+    c.drawPath(p, stroke=1, fill=0)
     
     # Draw measurement text
     text_width = c.stringWidth(text, "Helvetica", 8)
@@ -317,28 +526,50 @@ def draw_measurement(c, x1, y1, x2, y2, text, color=colors.black):
     text_y = (y1 + y2) / 2 + 10
     draw_text(c, text_x, text_y, text, 8, color)
 
-def draw_page(page_num, path, comments, include_text=True, include_shapes=True, include_measurements=False):
-    c = canvas.Canvas(path, pagesize=(PAGE_WIDTH, PAGE_HEIGHT), pageCompression=0)
-    
-    # Draw a light grid background
-    c.setStrokeColor(colors.lightgrey)
-    c.setLineWidth(0.1)
-    for x in range(0, int(PAGE_WIDTH), 50):
-        c.line(x, 0, x, PAGE_HEIGHT)
-    for y in range(0, int(PAGE_HEIGHT), 50):
-        c.line(0, y, PAGE_WIDTH, y)
+PAGE_FURNITURE_FORM = 'PageFurniture'
+
+def draw_page_furniture(c):
+    """Draw the static page background (the light grid). It is defined once per
+    canvas as a form XObject and each page only references it with doForm, so the
+    per-page content stream no longer carries the grid geometry."""
+    if not c.hasForm(PAGE_FURNITURE_FORM):
+        c.beginForm(PAGE_FURNITURE_FORM)
+        c.setStrokeColor(colors.lightgrey)
+        c.setLineWidth(0.1)
+        grid = c.beginPath()
+        for x in range(0, int(PAGE_WIDTH), 50):
+            grid.moveTo(x, 0)
+            grid.lineTo(x, PAGE_HEIGHT)
+        for y in range(0, int(PAGE_HEIGHT), 50):
+            grid.moveTo(0, y)
+            grid.lineTo(PAGE_WIDTH, y)
+        c.drawPath(grid, stroke=1, fill=0)
+        c.endForm()
+    c.doForm(PAGE_FURNITURE_FORM)
+
+def draw_page_content(c, page_num, comments, include_text=True, include_shapes=True, include_measurements=False, rng=random, timestamp=None,
+                      annots=None):
+    # rng may be a private random.Random so pages can be drawn reproducibly in any process;
+    # timestamp (a datetime) replaces the current date in the footer. If annots is a list,
+    # markups are appended to it as native annotations instead of being drawn
+    # Light grid background, shared by all pages as one form XObject
+    draw_page_furniture(c)
     
     # Add random markups based on selected types
     if include_text:
         # Add text annotations
-        count = random.randint(3, 8)
+        count = rng.randint(3, 8)
         for _ in range(count):
-            comment = random.choice(comments)
-            color = random.choice(COLORS)
+            comment = rng.choice(comments)
+            color = rng.choice(COLORS)
             w = 6 * len(comment) + 20
             h = 20
-            x = random.uniform(100, PAGE_WIDTH - w - 100)
-            y = random.uniform(100, PAGE_HEIGHT - h - 100)
+            x = rng.uniform(100, PAGE_WIDTH - w - 100)
+            y = rng.uniform(100, PAGE_HEIGHT - h - 100)
+            if annots is not None:
+                ex, ey = x + w/2 + rng.uniform(-100, 100), y + h/2 + rng.uniform(-100, 100)
+                annots.append(free_text((x, y, x + w, y + h), comment, color=color.rgb(), callout=(ex, ey)))
+                continue
             
             # Draw text box
             c.setStrokeColor(color)
@@ -351,7 +582,7 @@ def draw_page(page_num, path, comments, include_text=True, include_shapes=True,
             c.drawString(x + 5, y + 5, comment)
             
             # Draw arrow to a random point
-            ex, ey = x + w/2 + random.uniform(-100, 100), y + h/2 + random.uniform(-100, 100)
+            ex, ey = x + w/2 + rng.uniform(-100, 100), y + h/2 + rng.uniform(-100, 100)
             c.setStrokeColor(color)
             c.setLineWidth(1)
             c.line(x + w/2, y + h/2, ex, ey)
@@ -359,15 +590,21 @@ def draw_page(page_num, path, comments, include_text=True, include_shapes=True,
     
     if include_shapes:
         # Add random shapes
-        shape_count = random.randint(2, 5)
+        shape_count = rng.randint(2, 5)
         for _ in range(shape_count):
-            color = random.choice(COLORS)
-            x = random.uniform(100, PAGE_WIDTH - 200)
-            y = random.uniform(100, PAGE_HEIGHT - 200)
-            w = random.uniform(50, 300)
-            h = random.uniform(30, 100)
+            color = rng.choice(COLORS)
+            x = rng.uniform(100, PAGE_WIDTH - 200)
+            y = rng.uniform(100, PAGE_HEIGHT - 200)
+            w = rng.uniform(50, 300)
+            h = rng.uniform(30, 100)
             
-            if random.random() > 0.5:
+            if annots is not None:
+                if rng.random() > 0.5:
+                    annots.append(square((x, y, x + w, y + h), color.rgb()))
+                else:
+                    d = min(w, h)
+                    annots.append(circle((x, y, x + d, y + d), color.rgb()))
+            elif rng.random() > 0.5:
                 # Rectangle
                 draw_rectangle(c, x, y, w, h, color)
             else:
@@ -380,60 +617,134 @@ def draw_page(page_num, path, comments, include_text=True, include_shapes=True,
     
     if include_measurements:
         # Add random measurements
-        measure_count = random.randint(2, 4)
+        measure_count = rng.randint(2, 4)
+        measures = []
         for _ in range(measure_count):
-            color = random.choice(COLORS)
-            x1 = random.uniform(100, PAGE_WIDTH - 200)
-            y1 = random.uniform(100, PAGE_HEIGHT - 200)
-            x2 = x1 + random.uniform(50, 300)
-            y2 = y1 + random.uniform(-100, 100)
+            color = rng.choice(COLORS)
+            x1 = rng.uniform(100, PAGE_WIDTH - 200)
+            y1 = rng.uniform(100, PAGE_HEIGHT - 200)
+            x2 = x1 + rng.uniform(50, 300)
+            y2 = y1 + rng.uniform(-100, 100)
             length = ((x2 - x1)**2 + (y2 - y1)**2)**0.5
-            draw_measurement(c, x1, y1, x2, y2, f"{length/72:.1f} in", color)
+            if annots is not None:
+                annots.append(measurement((x1, y1), (x2, y2), f"{length/72:.1f} in", color.rgb()))
+            else:
+                measures.append((x1, y1, x2, y2, f"{length/72:.1f} in", color))
+        if measures:
+            # Marker geometry for all of the page's measurements in one pass
+            segments = measurement_segments([m[:4] for m in measures])
+            for (x1, y1, x2, y2, text, color), segs in zip(measures, segments):
+                draw_measurement(c, x1, y1, x2, y2, text, color, segments=segs)
     
     # Add footer
     c.setFont("Helvetica-Oblique", 10)
     c.setFillColor(colors.gray)
-    c.drawCentredString(PAGE_WIDTH/2, 30, f"AEC Test Document - Page {page_num} - Generated on {datetime.now().strftime('%Y-%m-%d')}")
-    
-    c.save()
+    c.drawCentredString(PAGE_WIDTH/2, 30, f"AEC Test Document - Page {page_num} - Generated on {(timestamp or datetime.now()).strftime('%Y-%m-%d')}")
 
-def generate_pdf(target_size_mb, page_count, comments, markup_types):
-    # Create temporary directory for pages
+def new_canvas(output, timestamp=None, compression='default'):
+    """Canvas for the test pages. With a timestamp the file is reproducible: reportlab's
+    invariant mode fixes the document ID and the Info dates are set to timestamp."""
+    c = canvas.Canvas(output, pagesize=(PAGE_WIDTH, PAGE_HEIGHT),
+                      pageCompression=reportlab_page_compression(compression),
+                      invariant=timestamp is not None)
+    if timestamp is not None:
+        c.setDateFormatter(lambda *_: pdf_date(timestamp))
+    return c
+
+def annotate_file(path, page_annotations, compression='default'):
+    """Add native annotations (page index -> list of annotations.Annotation) to the
+    PDF at path as an incremental update."""
+    with fitz.open(path) as doc:
+        if add_annotations(doc, page_annotations, compress=compression != 'none'):
+            doc.saveIncr()
+
+def draw_page(page_num, path, comments, include_text=True, include_shapes=True, include_measurements=False, rng=random, timestamp=None,
+              compression='default', markup_mode='drawn'):
+    c = new_canvas(path, timestamp, compression)
+    annots = [] if markup_mode == 'annotations' else None
+    draw_page_content(c, page_num, comments, include_text, include_shapes, include_measurements, rng=rng, timestamp=timestamp,
+                      annots=annots)
+    with compression_level(compression):
+        c.save()
+    if annots:
+        annotate_file(path, {0: annots}, compression)
+
+def write_pages(output, page_nums, comments, flags, seed, timestamp=None, compression='default', markup_mode='drawn'):
+    """Draw the given pages into a single canvas (showPage() between pages) and
+    write it to output, a path or binary file object. No per-page files are created.
+    With markup_mode='annotations' the markups are not drawn; the list of each
+    page's annotations is returned for annotate_file() instead (else None)."""
+    c = new_canvas(output, timestamp, compression)
+    page_annots = [] if markup_mode == 'annotations' else None
+    for page_num in page_nums:
+        annots = None
+        if page_annots is not None:
+            annots = []
+            page_annots.append(annots)
+        draw_page_content(c, page_num, comments, *flags, rng=page_rng(seed, page_num), timestamp=timestamp,
+                          annots=annots)
+        c.showPage()
+    with compression_level(compression):
+        c.save()
+    return page_annots
+
+def _write_pages_task(task):
+    # Top-level so it can be pickled for the process pool
+    output_path, page_nums, comments, flags, seed, timestamp, compression, markup_mode = task
+    annots = write_pages(output_path, page_nums, comments, flags, seed, timestamp, compression, markup_mode)
+    return output_path, annots
+
+def generate_pdf(target_size_mb, page_count, comments, markup_types, workers=1, seed=None, timestamp=None,
+                 pad_mode='null', compression='default', markup_mode='drawn'):
+    """Generate a page_count-page test PDF padded to target_size_mb.
+    Serially, all pages are drawn into one canvas written straight to the output.
+    With workers > 1, contiguous page ranges are drawn on a process pool (one file
+    per worker) and merged once; each page is seeded from (seed, page number) so
+    the output matches the serial run. With a timestamp the dates are fixed too, so
+    the same seed gives the same file. markup_mode='annotations' writes the markups
+    as native annotations (FreeText callouts, Square, Circle, PolyLine measurements),
+    added in one incremental update once all pages are written."""
+    # Create temporary directory for the output (and per-worker parts when parallel)
     temp_dir = tempfile.mkdtemp(dir=app.config['TEMP_FOLDER'])
-    page_paths = []
+    if seed is None:
+        seed = new_seed()
+    flags = ('text' in markup_types, 'shapes' in markup_types, 'measurements' in markup_types)
     
     try:
-        # Generate pages
-        for i in range(1, page_count + 1):
-            page_path = os.path.join(temp_dir, f"page_{i}.pdf")
-            draw_page(
-                i, 
-                page_path, 
-                comments,
-                include_text='text' in markup_types,
-                include_shapes='shapes' in markup_types,
-                include_measurements='measurements' in markup_types
-            )
-            page_paths.append(page_path)
-        
-        # Merge pages
         output_path = os.path.join(temp_dir, "output.pdf")
-        merger = PdfMerger()
-        for path in page_paths:
-            merger.append(path)
-        merger.write(output_path)
-        merger.close()
+        page_nums = list(range(1, page_count + 1))
+        chunks = split_pages(page_nums, resolve_workers(workers))
+        if len(chunks) <= 1:
+            # Single canvas, streamed directly to the output file
+            with open(output_path, 'wb') as f:
+                page_annots = write_pages(f, page_nums, comments, flags, seed, timestamp, compression, markup_mode)
+        else:
+            # Parallel fallback: one part file per worker, merged once
+            tasks = [
+                (os.path.join(temp_dir, f"part_{n}.pdf"), chunk, comments, flags, seed, timestamp, compression,
+                 markup_mode)
+                for n, chunk in enumerate(chunks)
+            ]
+            results = map_pages(_write_pages_task, tasks, workers)
+            part_paths = [path for path, _ in results]
+            page_annots = None
+            if markup_mode == 'annotations':
+                page_annots = [annots for _, part_annots in results for annots in part_annots]
+            merger = PdfMerger()
+            for path in part_paths:
+                merger.append(path)
+            merger.write(output_path)
+            merger.close()
+            for path in part_paths:
+                os.unlink(path)
+        if page_annots:
+            annotate_file(output_path, dict(enumerate(page_annots)), compression)
         
-        # Pad to target size if needed
+        # Pad to target size if needed (written in chunks, never as one big buffer), with
+        # null bytes or, for pad_mode='objects', an embedded random-data attachment.
+        # If the PDF is already larger than target, we can't shrink it and return it as is.
         target_bytes = int(target_size_mb * 1024 * 1024)
-        actual_size = os.path.getsize(output_path)
-        
-        if actual_size < target_bytes:
-            with open(output_path, 'ab') as f:
-                f.write(b'\0' * (target_bytes - actual_size))
-        elif actual_size > target_bytes:
-            # If the PDF is already larger than target, we can't shrink it
-            pass  # For now, we'll just return the PDF as is
+        fill_file(output_path, target_bytes, pad_mode, seed)
         
         return output_path
         
@@ -443,16 +754,33 @@ def generate_pdf(target_size_mb, page_count, comments, markup_types):
             shutil.rmtree(temp_dir, ignore_errors=True)
         raise
 
+def parse_metadata_form(form):
+    """Collect document metadata from the request form as PDF Info entries.
+    modifiedDate/creationDate are 'YYYY-MM-DD'; title/author are plain text and
+    'metadata' may hold a JSON object of custom keys."""
+    metadata = {}
+    for field, key in (('modifiedDate', '/ModDate'), ('creationDate', '/CreationDate')):
+        value = form.get(field)
+        if value:
+            metadata[key] = pdf_date(datetime.strptime(value, '%Y-%m-%d'))
+    for field, key in (('title', '/Title'), ('author', '/Author')):
+        value = form.get(field, '').strip()
+        if value:
+            metadata[key] = value
+    custom = form.get('metadata', '').strip()
+    if custom:
+        extra = json.loads(custom)
+        if not isinstance(extra, dict):
+            raise ValueError('metadata must be a JSON object')
+        for key, value in extra.items():
+            metadata[key if key.startswith('/') else '/' + key] = str(value)
+    return metadata
+
 @app.route('/')
 def index():
     # Look for PDF files in the uploads folder
-    default_pdf = None
-    uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-    if os.path.exists(uploads_dir):
-        for file in os.listdir(uploads_dir):
-            if file.lower().endswith('.pdf'):
-                default_pdf = file
-                break
+    default_pdf_path = find_default_pdf()
+    default_pdf = os.path.basename(default_pdf_path) if default_pdf_path else None
     
     return render_template('index.html', default_pdf=default_pdf)
 
@@ -462,117 +790,413 @@ def serve_upload(filename):
     uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), app.config['UPLOAD_FOLDER'])
     return send_from_directory(uploads_dir, filename, as_attachment=False)
 
+def find_default_pdf():
+    """Return the path of the first PDF in the uploads folder, or None."""
+    uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    if os.path.exists(uploads_dir):
+        for file in os.listdir(uploads_dir):
+            if file.lower().endswith('.pdf'):
+                return os.path.join(uploads_dir, file)
+    return None
+
+def warm_up(max_pages=None):
+    """Do the work a cold process would otherwise do on its first request: hash the
+    default PDF and render its pages into the page cache, which also loads the
+    lazily imported parts of fitz, FPDF and Pillow. Returns the pages rendered.
+    The document is closed again, so no open file is shared with forked workers."""
+    pdf_path = find_default_pdf()
+    if not pdf_path:
+        return 0
+    if max_pages is None:
+        max_pages = app.config['WARM_PAGES']
+    with fitz.open(pdf_path) as doc:
+        pages = min(len(doc), max_pages)
+    if pages:
+        generate_pdf_with_markdown(pdf_path, 'warm-up', page_count=pages)
+    return pages
+
+def parse_generate_options(form):
+    """Read the /generate form fields into generation options.
+    Raises ValueError with a user-facing message for invalid input."""
+    try:
+        metadata = parse_metadata_form(form)
+    except ValueError as e:
+        raise ValueError(f'Invalid metadata: {e}')
+    shape_types_raw = form.get('shapeTypes', '')
+    background = form.get('background', 'raster').strip().lower() or 'raster'
+    if background not in BACKGROUND_MODES:
+        raise ValueError(f'Invalid background mode: {background}')
+    # How the file is grown to targetSize: trailing null bytes or real PDF objects
+    pad_mode = form.get('padMode', 'null').strip().lower() or 'null'
+    if pad_mode not in PAD_MODES:
+        raise ValueError(f'Invalid pad mode: {pad_mode}')
+    compression = form.get('compression', 'default').strip().lower() or 'default'
+    if compression not in COMPRESSION_MODES:
+        raise ValueError(f'Invalid compression: {compression}')
+    markup_mode = form.get('markupMode', 'drawn').strip().lower() or 'drawn'
+    if markup_mode not in MARKUP_MODES:
+        raise ValueError(f'Invalid markup mode: {markup_mode}')
+    # Raster background rendering: resolution, colour space and image encoding
+    try:
+        render_dpi = int(form.get('renderDpi', '').strip() or DEFAULT_RENDER.dpi)
+        jpeg_quality = int(form.get('jpegQuality', '').strip() or DEFAULT_RENDER.quality)
+    except ValueError:
+        raise ValueError('renderDpi and jpegQuality must be integers')
+    if not 18 <= render_dpi <= 600:
+        raise ValueError('renderDpi must be between 18 and 600')
+    if not 1 <= jpeg_quality <= 95:
+        raise ValueError('jpegQuality must be between 1 and 95')
+    render_color = form.get('renderColor', 'rgb').strip().lower() or 'rgb'
+    if render_color not in RENDER_COLORSPACES:
+        raise ValueError(f'Invalid render color: {render_color}')
+    image_format = form.get('imageFormat', 'flate').strip().lower() or 'flate'
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Invalid image format: {image_format}')
+    # Source pages to use, e.g. "1-10,40-", "1-2000:50" or "random:25" (see page_selection)
+    pages = form.get('pages', '').strip() or None
+    if pages:
+        parse_spec(pages)
+    seed = form.get('seed', '').strip()
+    try:
+        seed = int(seed) if seed else None
+    except ValueError:
+        raise ValueError('seed must be an integer')
+    # Fixed timestamp ('YYYY-MM-DD' or ISO date-time) for reproducible output
+    timestamp = form.get('timestamp', '').strip()
+    try:
+        timestamp = datetime.fromisoformat(timestamp) if timestamp else None
+    except ValueError:
+        raise ValueError('timestamp must be an ISO date (YYYY-MM-DD[THH:MM:SS])')
+    # Pad PDF to target size if requested (if the PDF is larger, nothing is done)
+    target_bytes = 0
+    target_size_mb = form.get('targetSize')
+    if target_size_mb:
+        try:
+            target_bytes = int(float(target_size_mb) * 1024 * 1024)
+        except Exception as e:
+            print(f'Warning: Could not pad PDF to target size: {e}')
+    return {
+        'file_name': form.get('fileName', 'generated_document').strip(),
+        'markdown_content': form.get('markdown', ''),
+        'metadata': metadata,
+        # Markup options
+        'text_enabled': form.get('textEnabled', 'true').lower() == 'true',
+        'shapes_enabled': form.get('shapesEnabled', 'false').lower() == 'true',
+        'shape_types': [s.strip() for s in shape_types_raw.split(',') if s.strip()] if shape_types_raw else [],
+        'background': background,
+        'page_count': form.get('pageCount'),
+        'pages': pages,
+        'render_settings': RenderSettings(render_dpi, render_color, image_format, jpeg_quality),
+        'target_bytes': target_bytes,
+        'pad_mode': pad_mode,
+        'markup_mode': markup_mode,
+        'compression': compression,
+        'template_id': form.get('templateId', '').strip() or None,
+        'comments_path': None,  # uploaded comments file, see prepare_sources()
+        'seed': seed,
+        'timestamp': timestamp,
+    }
+
+def resolve_source_pdf(form, files, file_name):
+    """Pick the background PDF for a request: a stored template, the default from
+    uploads/ or the uploaded file.
+    Returns (pdf_path, output_filename, is_temporary); raises ValueError for bad input."""
+    template_id = form.get('templateId', '').strip()
+    if template_id:
+        pdf_path = template_store.path(template_id)
+        if not pdf_path:
+            raise ValueError('Unknown template')
+        output_filename = f'{file_name}.pdf' if file_name else 'annotated_template.pdf'
+        return pdf_path, output_filename, False
+
+    # Check if we should use the default PDF
+    use_default = form.get('useDefault') == 'true' or 'file' not in files
+    if use_default:
+        pdf_path = find_default_pdf()
+        if not pdf_path:
+            raise ValueError('No default PDF found')
+        output_filename = f'{file_name}.pdf' if file_name else f'annotated_{os.path.basename(pdf_path)}'
+        return pdf_path, output_filename, False
+
+    # Handle uploaded file
+    file = files['file']
+    if file.filename == '':
+        raise ValueError('No selected file')
+    if not file.filename.lower().endswith('.pdf'):
+        raise ValueError('Invalid file type')
+    # Save the uploaded file temporarily (unique name, so concurrent requests don't collide)
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf', dir=app.config['TEMP_FOLDER'])
+    with os.fdopen(fd, 'wb') as f:
+        file.save(f)
+    output_filename = f'{file_name}.pdf' if file_name else f'annotated_{file.filename}'
+    return pdf_path, output_filename, True
+
+def save_comments_upload(files):
+    """Save an uploaded comments file ('commentsFile': .txt, .md, .csv or .jsonl) to a
+    temporary file and return its path, or None if none was sent."""
+    file = files.get('commentsFile')
+    if file is None or file.filename == '':
+        return None
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in COMMENT_FILE_TYPES:
+        raise ValueError('Invalid comments file type')
+    fd, path = tempfile.mkstemp(suffix=ext, dir=app.config['TEMP_FOLDER'])
+    with os.fdopen(fd, 'wb') as f:
+        file.save(f)
+    return path
+
+def prepare_sources(form, files, options):
+    """Resolve the background PDF and save any comments upload (sets options['comments_path']).
+    Returns (pdf_path, output_filename, temp_paths); the caller removes temp_paths when done."""
+    pdf_path, output_filename, is_temp = resolve_source_pdf(form, files, options['file_name'])
+    temp_paths = [pdf_path] if is_temp else []
+    try:
+        options['comments_path'] = save_comments_upload(files)
+    except ValueError:
+        remove_files(temp_paths)
+        raise
+    if options['comments_path']:
+        temp_paths.append(options['comments_path'])
+    return pdf_path, output_filename, temp_paths
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def response_cache_key(pdf_path, options):
+    """Cache key for a seeded request: source content hash plus every option that
+    affects the bytes (the output file name and padding target do not)."""
+    if isinstance(pdf_path, fitz.Document):
+        pdf_path = pdf_path.name
+    source = options['template_id'] or file_digest(pdf_path)
+    params = {k: v for k, v in options.items() if k not in ('file_name', 'target_bytes', 'pad_mode', 'template_id')}
+    if params['comments_path']:
+        params['comments_path'] = file_digest(params['comments_path'])
+    return source, json.dumps(params, sort_keys=True, default=str)
+
+def build_pdf(pdf_path, options, progress=None, recorder=NULL_RECORDER):
+    """Generate the annotated PDF for parsed options and stamp its metadata.
+    Returns (pdf_bytes, stats); padding is left to the caller.
+    Requests with a seed are deterministic, so their output is cached and a
+    repeated request returns the same bytes without generating again."""
+    cache_key = None
+    if options['seed'] is not None and app.config['RESPONSE_CACHE_MB']:
+        cache_key = response_cache_key(pdf_path, options)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            pdf_bytes, stats = cached
+            return pdf_bytes, {**stats, 'cached': True}
+    stats = {}
+    def generate_from(source):
+        return generate_pdf_with_markdown(
+            source,
+            iter_comments(options['markdown_content'], options['comments_path']),
+            page_count=options['page_count'],
+            text_enabled=options['text_enabled'],
+            shapes_enabled=options['shapes_enabled'],
+            shape_types=options['shape_types'],
+            background=options['background'],
+            stats=stats,
+            progress=progress,
+            recorder=recorder,
+            seed=options['seed'],
+            timestamp=options['timestamp'],
+            compression=options['compression'],
+            markup_mode=options['markup_mode'],
+            pages=options['pages'],
+            render_settings=options['render_settings'],
+        )
+    if options['template_id']:
+        # Reuse the store's open document; it is locked to this request meanwhile
+        with template_store.open(options['template_id']) as doc:
+            pdf_bytes = generate_from(doc)
+    else:
+        pdf_bytes = generate_from(pdf_path)
+
+    # Set requested metadata (ModDate etc.) as an incremental update appended
+    # to the generated bytes; the cost does not depend on the page count
+    if options['metadata']:
+        try:
+            with recorder.span('metadata'):
+                pdf_bytes = set_pdf_metadata(pdf_bytes, options['metadata'])
+        except Exception as e:
+            print(f'Warning: could not set PDF metadata: {e}')
+    if cache_key is not None:
+        response_cache.put(cache_key, (pdf_bytes, stats), len(pdf_bytes))
+    return pdf_bytes, stats
+
+def make_recorder(req):
+    """Span recorder for a request: real when profiling is on for the app or asked
+    for with profile=true / an X-Profile header, otherwise the no-op recorder."""
+    wanted = app.config['PROFILING'] or req.form.get('profile', '').lower() == 'true' or 'X-Profile' in req.headers
+    if not wanted:
+        return NULL_RECORDER
+    return SpanRecorder(trace_memory=app.config['PROFILE_MEMORY'])
+
+def iter_timed(chunks, recorder, span_name, on_done):
+    """Yield chunks while timing the whole iteration as one span; on_done runs at the end."""
+    try:
+        with recorder.span(span_name):
+            yield from chunks
+    finally:
+        on_done()
+
 @app.route('/generate', methods=['POST'])
 def generate():
     try:
-        # Get form data
-        file_name = request.form.get('fileName', 'generated_document').strip()
-        markdown_content = request.form.get('markdown', '')
-        modified_date_str = request.form.get('modifiedDate')  # 'YYYY-MM-DD' or None
-        # Markup options
-        text_enabled = (request.form.get('textEnabled', 'true').lower() == 'true')
-        shapes_enabled = (request.form.get('shapesEnabled', 'false').lower() == 'true')
-        shape_types_raw = request.form.get('shapeTypes', '')
-        shape_types = [s.strip() for s in shape_types_raw.split(',') if s.strip()] if shape_types_raw else []
+        recorder = make_recorder(request)
+        try:
+            options = parse_generate_options(request.form)
+            with recorder.span('source'):
+                pdf_path, output_filename, temp_paths = prepare_sources(request.form, request.files, options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Check if we should use the default PDF
-        use_default = request.form.get('useDefault') == 'true' or 'file' not in request.files
+        try:
+            pdf_bytes, stats = build_pdf(pdf_path, options, recorder=recorder)
+        finally:
+            # Clean up temporary files if we created any
+            remove_files(temp_paths)
         
-        if use_default:
-            # Get the first PDF from the uploads folder
-            default_pdf = None
-            uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-            if os.path.exists(uploads_dir):
-                for file in os.listdir(uploads_dir):
-                    if file.lower().endswith('.pdf'):
-                        default_pdf = file
-                        break
-            
-            if not default_pdf:
-                return jsonify({'error': 'No default PDF found'}), 400
-                
-            pdf_path = os.path.join(uploads_dir, default_pdf)
-            output_filename = f'{file_name}.pdf' if file_name else f'annotated_{default_pdf}'
-        else:
-            # Handle uploaded file
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
-            
-            if not file.filename.lower().endswith('.pdf'):
-                return jsonify({'error': 'Invalid file type'}), 400
-            
-            # Save the uploaded file temporarily
-            pdf_path = os.path.join(tempfile.gettempdir(), file.filename)
-            file.save(pdf_path)
-            output_filename = f'{file_name}.pdf' if file_name else f'annotated_{file.filename}'
+        # Create a streamed response with the PDF followed by any padding. The
+        # padding is streamed in fixed-size chunks instead of being concatenated.
+        target_bytes = options['target_bytes']
+        total_bytes = len(pdf_bytes) + padding_needed(len(pdf_bytes), target_bytes)
+        body = iter_filled(pdf_bytes, target_bytes, options['pad_mode'], options['seed'])
+        if recorder.enabled:
+            # Streaming/padding happens after the headers are sent, so it only
+            # shows up in the log line written once the body is done
+            log_fields = {'path': request.path, 'bytes': total_bytes, 'pages': options['page_count']}
+            body = iter_timed(body, recorder, 'stream', lambda: print(f'PROFILE {recorder.log_line(**log_fields)}'))
+        response = Response(body, mimetype='application/pdf')
+        response.headers['Content-Disposition'] = f'attachment; filename="{output_filename}"'
+        response.headers['Content-Length'] = total_bytes
+        response.headers['X-Unplaced-Comments'] = str(stats.get('unplaced_count', 0))
+        response.headers['X-Compression'] = options['compression']
+        if options['seed'] is not None:
+            response.headers['X-Cache'] = 'hit' if stats.get('cached') else 'miss'
+        if recorder.enabled:
+            response.headers['Server-Timing'] = recorder.server_timing()
         
-        try:
-            # Generate PDF with markdown overlay
-            # Get requested page count
-            page_count = request.form.get('pageCount')
-            pdf_bytes = generate_pdf_with_markdown(
-                pdf_path,
-                markdown_content,
-                page_count=page_count,
-                text_enabled=text_enabled,
-                shapes_enabled=shapes_enabled,
-                shape_types=shape_types,
-            )
-
-            # If a modified date is provided, set it as PDF ModDate metadata
-            if modified_date_str:
-                try:
-                    # Parse date and build PDF date string D:YYYYMMDDHHmmSS
-                    dt = datetime.strptime(modified_date_str, '%Y-%m-%d')
-                    pdf_date = f"D:{dt.strftime('%Y%m%d')}000000"
-                    reader = PdfReader(io.BytesIO(pdf_bytes))
-                    writer = PdfWriter()
-                    for p in reader.pages:
-                        writer.add_page(p)
-                    # Preserve existing metadata and override ModDate
-                    meta = {} if reader.metadata is None else dict(reader.metadata)
-                    meta['/ModDate'] = pdf_date
-                    writer.add_metadata(meta)
-                    out_bio = io.BytesIO()
-                    writer.write(out_bio)
-                    pdf_bytes = out_bio.getvalue()
-                except Exception as e:
-                    print(f'Warning: could not set PDF ModDate: {e}')
-            
-            # Pad PDF to target size if requested
-            target_size_mb = request.form.get('targetSize')
-            if target_size_mb:
-                try:
-                    target_bytes = int(float(target_size_mb) * 1024 * 1024)
-                    if len(pdf_bytes) < target_bytes:
-                        pdf_bytes += b'\0' * (target_bytes - len(pdf_bytes))
-                    # If PDF is larger, do nothing
-                except Exception as e:
-                    print(f'Warning: Could not pad PDF to target size: {e}')
-            
-            # Clean up temporary file if we created one
-            if not use_default and os.path.exists(pdf_path):
-                os.unlink(pdf_path)
-            
-            # Create a response with the PDF
-            response = make_response(pdf_bytes)
-            response.headers['Content-Type'] = 'application/pdf'
-            response.headers['Content-Disposition'] = f'attachment; filename="{output_filename}"'
-            response.headers['Content-Length'] = len(pdf_bytes)
-            
-            return response
-            
-        except Exception as e:
-            # Clean up temporary file in case of error
-            if not use_default and os.path.exists(pdf_path):
-                os.unlink(pdf_path)
-            raise e
+        return response
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/templates', methods=['POST'])
+def upload_template():
+    """Store an uploaded template PDF once and return its id for later templateId requests."""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Invalid file type'}), 400
+    try:
+        template_id = template_store.add(file.stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(template_store.info(template_id)), 201
+
+@app.route('/templates/<template_id>')
+def template_info(template_id):
+    info = template_store.info(template_id)
+    if info is None:
+        return jsonify({'error': 'Unknown template'}), 404
+    return jsonify(info)
+
+@app.route('/batch', methods=['POST'])
+def batch_generate():
+    """Generate several variants of one template and stream them back as a ZIP.
+    'variants' is a JSON list of objects overriding the other /generate form fields."""
+    try:
+        variants = json.loads(request.form.get('variants', ''))
+    except ValueError:
+        variants = None
+    if not isinstance(variants, list) or not variants or not all(isinstance(v, dict) for v in variants):
+        return jsonify({'error': 'variants must be a non-empty JSON list of objects'}), 400
+    if len(variants) > app.config['BATCH_MAX_VARIANTS']:
+        return jsonify({'error': f"At most {app.config['BATCH_MAX_VARIANTS']} variants per batch"}), 400
+    defaults = {k: v for k, v in request.form.items() if k != 'variants'}
+    try:
+        pdf_path, _, is_temp = resolve_source_pdf(request.form, request.files, '')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        results = iter_batch(pdf_path, variants, defaults, workers=app.config['BATCH_WORKERS'])
+    except ValueError as e:
+        if is_temp and os.path.exists(pdf_path):
+            os.unlink(pdf_path)
+        return jsonify({'error': str(e)}), 400
+
+    def body():
+        try:
+            yield from iter_zip(results)
+        finally:
+            if is_temp and os.path.exists(pdf_path):
+                os.unlink(pdf_path)
+
+    zip_name = (request.form.get('fileName') or 'variants').strip()
+    response = Response(body(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{zip_name}.zip"'
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a generation job (same form fields as /generate) and return its id."""
+    recorder = make_recorder(request)
+    try:
+        options = parse_generate_options(request.form)
+        pdf_path, output_filename, temp_paths = prepare_sources(request.form, request.files, options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def run(job):
+        try:
+            pdf_bytes, stats = build_pdf(pdf_path, options, progress=job.report_pages, recorder=recorder)
+        finally:
+            remove_files(temp_paths)
+        job.extra['unplaced_comments'] = stats.get('unplaced_count', 0)
+        job.extra['compression'] = options['compression']
+        job.bytes_total = len(pdf_bytes) + padding_needed(len(pdf_bytes), options['target_bytes'])
+        with recorder.span('write'), open(job.result_path, 'wb') as f:
+            for chunk in iter_filled(pdf_bytes, options['target_bytes'], options['pad_mode'], options['seed']):
+                f.write(chunk)
+                job.bytes_written += len(chunk)
+        if recorder.enabled:
+            job.extra['timings'] = recorder.summary()
+            print(f'PROFILE {recorder.log_line(job=job.id, bytes=job.bytes_total, pages=options["page_count"])}')
+
+    try:
+        job = job_manager.submit(run, client=request.remote_addr, filename=output_filename)
+    except JobRejected as e:
+        remove_files(temp_paths)
+        return jsonify({'error': str(e)}), 429
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f'Job is {job.status}', 'status': job.status}), 409
+    return send_file(job.result_path, mimetype='application/pdf', as_attachment=True,
+                     download_name=job.filename)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+batch.py
+
+Generates many variant PDFs from one template in a single run. Each variant
+is a dict of the same fields /generate takes (fileName, pageCount, targetSize,
+modifiedDate, markdown, background, ...) laid over shared defaults.
+
+Variants are built on a pool of worker processes. Every worker opens the
+template once and keeps it open for all the variants it builds, and the
+workers share an on-disk rendered-page cache (PAGE_CACHE_DIR, or a temporary
+one for the run), so the template's pages are rendered once per batch rather
+than once per file. Results come back as each variant finishes and are written
+to a directory or streamed into a ZIP; padding up to targetSize is streamed
+in chunks in both cases and never held in memory.
+
+    python3 batch.py template.pdf variants.json -o variants.zip
+    python3 batch.py template.pdf variants.json --out-dir out/ --workers 4
+
+variants.json is either a list of variant objects or
+{"defaults": {...}, "variants": [...]}.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from filler import iter_filled
+from parallel import resolve_workers
+
+_templates = {}  # per-process open template documents, by path
+
+
+def _init_worker(cache_dir):
+    # Runs before the worker imports app/rendering, so PAGE_CACHE picks it up
+    if cache_dir:
+        os.environ['PAGE_CACHE_DIR'] = cache_dir
+
+
+def _open_template(path):
+    import fitz  # PyMuPDF
+    doc = _templates.get(path)
+    if doc is None:
+        doc = _templates[path] = fitz.open(path)
+    return doc
+
+
+def _build_variant(task):
+    """Build one variant in this process; returns (index, name, pdf_bytes, unplaced, options)."""
+    import app
+    index, name, template_path, fields = task
+    options = app.parse_generate_options(fields)
+    pdf_bytes, stats = app.build_pdf(_open_template(template_path), options)
+    return index, name, pdf_bytes, stats.get('unplaced_count', 0), options
+
+
+def variant_names(variants):
+    """Unique output file names (<fileName>.pdf, default variant_NNN.pdf) for the variants."""
+    names, seen = [], set()
+    for i, fields in enumerate(variants, start=1):
+        base = (fields.get('fileName') or '').strip() or f'variant_{i:03d}'
+        base = os.path.basename(base)
+        if base.lower().endswith('.pdf'):
+            base = base[:-4]
+        name, n = f'{base}.pdf', 1
+        while name in seen:
+            n += 1
+            name = f'{base}_{n}.pdf'
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def iter_batch(template_path, variants, defaults=None, workers=1):
+    """Return an iterator of (index, name, pdf_bytes, unplaced, options) that
+    yields each variant as it finishes (not in input order when workers > 1).
+    Raises ValueError right away, before any work starts, if a variant has invalid fields."""
+    import app
+    template_path = os.path.abspath(template_path)
+    tasks = []
+    for index, (name, fields) in enumerate(zip(variant_names(variants), variants)):
+        merged = {**(defaults or {}), **{k: str(v) for k, v in fields.items()}}
+        merged.pop('templateId', None)  # the template is given by path
+        try:
+            app.parse_generate_options(merged)
+        except ValueError as e:
+            raise ValueError(f'Variant {index + 1} ({name}): {e}')
+        tasks.append((index, name, template_path, merged))
+    return _run_tasks(tasks, workers)
+
+
+def _run_tasks(tasks, workers):
+    workers = min(resolve_workers(workers), len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield _build_variant(task)
+        return
+
+    cache_dir = tmp_cache = None
+    if not os.environ.get('PAGE_CACHE_DIR'):
+        cache_dir = tmp_cache = tempfile.mkdtemp(prefix='pdf_batch_cache_')
+    # spawn rather than fork: the web app calling this has other threads running
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(cache_dir,)) as executor:
+            futures = [executor.submit(_build_variant, task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        if tmp_cache:
+            shutil.rmtree(tmp_cache, ignore_errors=True)
+
+
+def _iter_output(pdf_bytes, options):
+    # The variant's PDF grown to its targetSize with its padMode
+    return iter_filled(pdf_bytes, options['target_bytes'], options['pad_mode'], options['seed'])
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object that collects what ZipFile writes."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(results):
+    """Stream a ZIP of the batch results. Entries are stored (PDF data is already
+    compressed) and written in finishing order; padding is written into each
+    entry in chunks, so nothing is buffered beyond one PDF."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for _, name, pdf_bytes, _, options in results:
+            # force_zip64: the final size is only known after the padding is written
+            with zf.open(name, 'w', force_zip64=True) as entry:
+                for chunk in _iter_output(pdf_bytes, options):
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def write_dir(results, output_dir):
+    """Write each finished variant (padded) into output_dir; yields (name, path, size)."""
+    os.makedirs(output_dir, exist_ok=True)
+    for _, name, pdf_bytes, _, options in results:
+        path = os.path.join(output_dir, name)
+        with open(path, 'wb') as f:
+            for chunk in _iter_output(pdf_bytes, options):
+                f.write(chunk)
+        yield name, path, os.path.getsize(path)
+
+
+def load_spec(path):
+    """Read a variants file: a list of variants or {"defaults": {...}, "variants": [...]}."""
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'variants': spec}
+    variants = spec.get('variants')
+    if not isinstance(variants, list) or not all(isinstance(v, dict) for v in variants):
+        raise ValueError('variants must be a list of objects')
+    defaults = {k: str(v) for k, v in (spec.get('defaults') or {}).items()}
+    return defaults, variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('template', help='template PDF')
+    parser.add_argument('variants', help='JSON variants file')
+    out = parser.add_mutually_exclusive_group(required=True)
+    out.add_argument('-o', '--zip', help='write a ZIP archive to this path')
+    out.add_argument('--out-dir', help='write the PDFs into this directory')
+    parser.add_argument('--workers', type=int, default=-1, help='worker processes (default: all CPUs)')
+    args = parser.parse_args()
+
+    defaults, variants = load_spec(args.variants)
+    results = iter_batch(args.template, variants, defaults, workers=args.workers)
+    if args.out_dir:
+        for name, path, size in write_dir(results, args.out_dir):
+            print(f'{name}: {size / (1024 * 1024):.2f} MB')
+        return
+    with open(args.zip, 'wb') as f:
+        for chunk in iter_zip(results):
+            f.write(chunk)
+    print(f'{len(variants)} variants written to {args.zip}')
+
+
+if __name__ == '__main__':
+    main()
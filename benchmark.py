@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+
+Benchmarks the PDF generators on synthetic inputs built from mock_bluebeam.pdf:
+
+  markdown   app.generate_pdf_with_markdown (+ metadata stamp + padding)
+  reportlab  app.generate_pdf
+  generator  PDFMarkdownGenerator.generate_pdf
+  proj       proj.py pipeline (generate_document + pad_to_target)
+
+Each case runs in a fresh process so peak RSS is per case. For every stage the
+wall time, process peak RSS after the stage and output bytes are recorded, and
+the results are written as JSON so runs can be compared between commits:
+
+    python3 benchmark.py --quick -o before.json
+    python3 benchmark.py --quick -o after.json --compare before.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MOCK_PDF = os.path.join(HERE, 'mock_bluebeam.pdf')
+
+# ─── CASE MATRICES ─────────────────────────────────────────────────────────────
+FULL = {
+    'markdown': {
+        'pages': [1, 10, 100, 1000],
+        'comments': [0, 100, 1000, 10000],
+        'shapes': ['none', 'box', 'cloud', 'pen'],
+        'background': ['raster', 'vector'],
+    },
+    'reportlab': {'pages': [1, 10, 100, 1000], 'markups': ['text', 'text,shapes,measurements']},
+    'generator': {'pages': [1, 10, 100]},
+    'proj': {'pages': [1, 10, 100, 1000]},
+}
+QUICK = {
+    'markdown': {
+        'pages': [1, 10],
+        'comments': [0, 100],
+        'shapes': ['none', 'cloud'],
+        'background': ['raster', 'vector'],
+    },
+    'reportlab': {'pages': [1, 10], 'markups': ['text,shapes,measurements']},
+    'generator': {'pages': [1, 10]},
+    'proj': {'pages': [1, 10]},
+}
+TARGET_SIZE_MB = 20  # padding target used by every case
+# ────────────────────────────────────────────────────────────────────────────────
+
+
+def peak_rss_kb():
+    # ru_maxrss is KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class StageRecorder:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        result = {'output_bytes': None}
+        start = time.perf_counter()
+        yield result
+        self.stages[name] = {
+            'wall_s': round(time.perf_counter() - start, 6),
+            'peak_rss_kb': peak_rss_kb(),
+            'output_bytes': result['output_bytes'],
+        }
+
+
+def make_template(pages, path):
+    """Build a synthetic template by repeating the mock Bluebeam page."""
+    import fitz
+    src = fitz.open(MOCK_PDF)
+    out = fitz.open()
+    while len(out) < pages:
+        out.insert_pdf(src, to_page=min(len(src), pages - len(out)) - 1)
+    out.save(path)
+
+
+def make_comments(count):
+    from app import DEFAULT_COMMENTS
+    return '\n'.join(f'{DEFAULT_COMMENTS[i % len(DEFAULT_COMMENTS)]} ({i})' for i in range(count))
+
+
+def run_markdown(params, workdir, rec):
+    import app
+    from padding import pad_file
+    from pdf_metadata import set_pdf_metadata
+    template = os.path.join(workdir, 'template.pdf')
+    with rec.stage('inputs') as r:
+        make_template(params['pages'], template)
+        markdown = make_comments(params['comments'])
+        r['output_bytes'] = os.path.getsize(template)
+    shapes = params['shapes']
+    with rec.stage('generate') as r:
+        pdf_bytes = app.generate_pdf_with_markdown(
+            template, markdown, page_count=params['pages'], text_enabled=True,
+            shapes_enabled=shapes != 'none', shape_types=[] if shapes == 'none' else [shapes],
+            background=params['background'])
+        r['output_bytes'] = len(pdf_bytes)
+    with rec.stage('metadata') as r:
+        pdf_bytes = set_pdf_metadata(pdf_bytes, {'/ModDate': 'D:20240101000000'})
+        r['output_bytes'] = len(pdf_bytes)
+    out = os.path.join(workdir, 'out.pdf')
+    with rec.stage('pad') as r:
+        with open(out, 'wb') as f:
+            f.write(pdf_bytes)
+        pad_file(out, TARGET_SIZE_MB * 1024 * 1024)
+        r['output_bytes'] = os.path.getsize(out)
+
+
+def run_reportlab(params, workdir, rec):
+    import app
+    app.app.config['TEMP_FOLDER'] = workdir
+    with rec.stage('generate+pad') as r:
+        path = app.generate_pdf(TARGET_SIZE_MB, params['pages'], app.DEFAULT_COMMENTS,
+                                params['markups'].split(','), seed=1)
+        r['output_bytes'] = os.path.getsize(path)
+
+
+def run_generator(params, workdir, rec):
+    from pdf_markdown_generator import PDFMarkdownGenerator, generate_sample_markdown
+    with rec.stage('inputs'):
+        generator = PDFMarkdownGenerator(MOCK_PDF, output_dir=workdir)
+        for _ in range(params['pages']):
+            generator.add_markdown(generate_sample_markdown())
+            generator.new_page()
+    with rec.stage('generate') as r:
+        path = generator.generate_pdf('bench.pdf')
+        r['output_bytes'] = os.path.getsize(path)
+
+
+def run_proj(params, workdir, rec):
+    import proj
+    proj.PAGES = params['pages']
+    proj.TARGET_SIZE_MB = TARGET_SIZE_MB
+    proj.TEMP_DIR = os.path.join(workdir, 'tmp_pages')
+    proj.OUTPUT_PDF = os.path.join(workdir, 'proj.pdf')
+    with rec.stage('generate') as r:
+        proj.generate_document(seed=1)
+        r['output_bytes'] = os.path.getsize(proj.OUTPUT_PDF)
+    with rec.stage('pad') as r:
+        proj.pad_to_target()
+        r['output_bytes'] = os.path.getsize(proj.OUTPUT_PDF)
+
+
+RUNNERS = {
+    'markdown': run_markdown,
+    'reportlab': run_reportlab,
+    'generator': run_generator,
+    'proj': run_proj,
+}
+
+
+def _case_worker(suite, params, queue):
+    os.chdir(tempfile.mkdtemp(prefix='pdf_bench_'))
+    sys.stdout = open(os.devnull, 'w')  # the generators print progress
+    rec = StageRecorder()
+    try:
+        RUNNERS[suite](params, os.getcwd(), rec)
+        queue.put({'stages': rec.stages})
+    except Exception as e:
+        queue.put({'stages': rec.stages, 'error': repr(e)})
+
+
+def run_case(suite, params):
+    """Run one case in a fresh process and return its stage measurements."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    start = time.perf_counter()
+    proc = ctx.Process(target=_case_worker, args=(suite, params, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    result.update(suite=suite, params=params, total_wall_s=round(time.perf_counter() - start, 6))
+    # Time spent in the measured stages, excluding process start-up, imports and input building
+    result['work_s'] = round(sum(s['wall_s'] for name, s in result['stages'].items() if name != 'inputs'), 6)
+    return result
+
+
+def expand(matrix):
+    keys = list(matrix)
+    for values in itertools.product(*(matrix[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def case_id(result):
+    return result['suite'] + ':' + ','.join(f'{k}={v}' for k, v in result['params'].items())
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {case_id(r): r for r in json.load(f)['results']}
+    print(f"\n{'case (stage wall time)':<70} {'base s':>9} {'now s':>9} {'ratio':>7}")
+    for r in results:
+        old = baseline.get(case_id(r))
+        if not old:
+            continue
+        ratio = r['work_s'] / old['work_s'] if old['work_s'] else float('nan')
+        print(f"{case_id(r):<70} {old['work_s']:>9.3f} {r['work_s']:>9.3f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='small matrix for a fast smoke run')
+    parser.add_argument('--suite', action='append', choices=sorted(RUNNERS), help='only run these suites')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', metavar='BASELINE', help='print wall-time ratios against a previous results file')
+    args = parser.parse_args()
+
+    matrices = QUICK if args.quick else FULL
+    suites = args.suite or list(matrices)
+    results = []
+    for suite in suites:
+        for params in expand(matrices[suite]):
+            result = run_case(suite, params)
+            results.append(result)
+            status = result.get('error') or 'ok'
+            print(f"{case_id(result):<70} {result['work_s']:>9.3f}s  {status}")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'target_size_mb': TARGET_SIZE_MB,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Lazy comment sources for the markdown generator.
+
+Comments come from the markdown form field (one per non-empty line) and/or an
+uploaded file: plain text / markdown (one per line), CSV (the comment/text
+column if there is a header naming one, else the first column) or JSON Lines
+(strings, or objects with a "comment" or "text" key). Every source is read
+one comment at a time, so memory does not grow with the number of comments.
+"""
+
+import csv
+import io
+import itertools
+import json
+import os
+
+COMMENT_FILE_TYPES = ('.txt', '.md', '.csv', '.jsonl', '.ndjson')
+_COLUMN_NAMES = ('comment', 'text', 'markup')
+
+
+def iter_text_lines(text):
+    """Yield the stripped, non-empty lines of text without splitting it all at once."""
+    start = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+        line = text[start:end].strip()
+        if line:
+            yield line
+        start = end + 1
+
+
+def _iter_csv(lines):
+    reader = csv.reader(lines)
+    first = next(reader, None)
+    if first is None:
+        return
+    names = [c.strip().lower() for c in first]
+    column = next((names.index(n) for n in _COLUMN_NAMES if n in names), None)
+    if column is None:
+        column = 0
+        reader = itertools.chain([first], reader)  # no header: the first row is a comment too
+    for row in reader:
+        if len(row) > column and row[column].strip():
+            yield row[column].strip()
+
+
+def _iter_jsonl(lines):
+    invalid = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            invalid += 1
+            continue
+        if isinstance(item, dict):
+            item = next((item[k] for k in _COLUMN_NAMES if k in item), None)
+        if isinstance(item, str) and item.strip():
+            yield item.strip()
+    if invalid:
+        print(f"Warning: skipped {invalid} invalid JSON line(s) in the comments file")
+
+
+def iter_comments_file(path):
+    """Yield the comments in a text/CSV/JSONL file, reading it incrementally."""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as raw:
+        lines = io.TextIOWrapper(raw, encoding='utf-8', errors='replace', newline='')
+        if ext == '.csv':
+            yield from _iter_csv(lines)
+        elif ext in ('.jsonl', '.ndjson'):
+            yield from _iter_jsonl(lines)
+        else:
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def iter_comments(markdown_content='', comments_path=None):
+    """All comments of a request: the form field's lines, then the uploaded file's."""
+    if markdown_content:
+        yield from iter_text_lines(markdown_content)
+    if comments_path:
+        yield from iter_comments_file(comments_path)
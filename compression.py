@@ -0,0 +1,86 @@
+"""
+Output compression settings shared by the generators.
+
+  default  what each generator did before (FPDF streams at zlib level 6,
+           reportlab pages uncompressed)
+  none     no stream compression (images are stored with zlib level 0)
+  fast     zlib level 1
+  max      zlib level 9
+
+fpdf2 and reportlab read their zlib level from module-level globals. Those are
+replaced with per-thread values here, and compression_level() sets the level
+for the current thread only, so concurrent requests with different settings
+do not interfere with each other.
+"""
+
+import threading
+import zlib
+from contextlib import contextmanager
+
+COMPRESSION_MODES = ('default', 'none', 'fast', 'max')
+ZLIB_LEVELS = {'none': 0, 'fast': 1, 'max': 9}
+
+_local = threading.local()
+
+
+class _ThreadLevel:
+    """Data descriptor standing in for a library's global zlib level."""
+
+    def __init__(self, default):
+        self.default = default
+
+    def __get__(self, obj, owner=None):
+        level = getattr(_local, 'level', None)
+        return self.default if level is None else level
+
+    def __set__(self, obj, value):
+        self.default = value
+
+
+class _ReportlabZlib:
+    # reportlab's pdfdoc calls zlib.compress(data) without a level
+    def __getattr__(self, name):
+        return getattr(zlib, name)
+
+    def compress(self, data, level=None):
+        if level is None:
+            level = getattr(_local, 'level', None)
+        return zlib.compress(data, -1 if level is None else level)
+
+
+def _install():
+    from fpdf import image_parsing
+    from fpdf.syntax import PDFContentStream
+    from reportlab.pdfbase import pdfdoc
+    PDFContentStream._COMPRESSION_LEVEL = _ThreadLevel(PDFContentStream._COMPRESSION_LEVEL)
+    type(image_parsing.SETTINGS).compression_level = _ThreadLevel(image_parsing.SETTINGS.compression_level)
+    pdfdoc.zlib = _ReportlabZlib()
+
+
+_install()
+
+
+@contextmanager
+def compression_level(mode):
+    """Use the zlib level for mode in fpdf2/reportlab on this thread while the block runs."""
+    previous = getattr(_local, 'level', None)
+    _local.level = ZLIB_LEVELS.get(mode)
+    try:
+        yield
+    finally:
+        _local.level = previous
+
+
+def fpdf_compress(mode):
+    """Value for FPDF.set_compression()."""
+    return mode != 'none'
+
+
+def reportlab_page_compression(mode):
+    """Value for the reportlab Canvas pageCompression argument."""
+    return 1 if mode in ('fast', 'max') else 0
+
+
+def fitz_deflate(mode):
+    """Whether PyMuPDF should deflate uncompressed streams when saving."""
+    return mode in ('fast', 'max')
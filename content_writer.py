@@ -0,0 +1,88 @@
+"""
+Low-level content-stream writer for overlay pages.
+
+Overlay markups used to go through fpdf2's high-level API one call at a time
+(set_draw_color, rect, set_xy, cell), and each call pays for FPDF's attribute
+and state bookkeeping. ContentWriter collects the operators for one page in
+a bytearray instead, writing colour, line width and font changes only when
+they differ from the current state, and write_to() appends the finished
+operators to the FPDF page's content stream in one go. Everything else
+(pages, backgrounds, fonts, output) still goes through FPDF.
+
+Coordinates are in points with the origin top-left, like FPDF(unit='pt').
+"""
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '(': '\\(', ')': '\\)', '\r': '\\r'})
+
+
+def _color(r, g, b):
+    # Same number format as fpdf2 (0-255 components, normalized to 0-1)
+    return ' '.join(f'{v / 255:.4f}'.rstrip('0').rstrip('.') or '0' for v in (r, g, b))
+
+
+class ContentWriter:
+    """Operators for one page, with deduplicated graphics state."""
+
+    def __init__(self, page_height, encoding='latin-1'):
+        self.page_height = page_height
+        self.encoding = encoding
+        self.buf = bytearray()
+        self._stroke = None
+        self._fill = None
+        self._line_width = None
+        self._font = None
+
+    def __len__(self):
+        return len(self.buf)
+
+    def stroke_color(self, r, g, b):
+        if self._stroke != (r, g, b):
+            self._stroke = (r, g, b)
+            self.buf += f'{_color(r, g, b)} RG\n'.encode('ascii')
+
+    def fill_color(self, r, g, b):
+        if self._fill != (r, g, b):
+            self._fill = (r, g, b)
+            self.buf += f'{_color(r, g, b)} rg\n'.encode('ascii')
+
+    def line_width(self, width):
+        if self._line_width != width:
+            self._line_width = width
+            self.buf += f'{width:.2f} w\n'.encode('ascii')
+
+    def font(self, font_id, size):
+        """Select font resource /F<font_id> (FPDF's font.i) at size points."""
+        if self._font != (font_id, size):
+            self._font = (font_id, size)
+            self.buf += f'BT /F{font_id} {size:.2f} Tf ET\n'.encode('ascii')
+
+    def rect(self, x, y, w, h):
+        """Stroke the outline of a rectangle."""
+        self.buf += f'{x:.2f} {self.page_height - y:.2f} {w:.2f} {-h:.2f} re S\n'.encode('ascii')
+
+    def path(self, ops):
+        """Append ready-made path operators (e.g. from geometry)."""
+        self.buf += ops.encode('ascii')
+        self.buf += b'\n'
+
+    def text_lines(self, x, y, lines, line_height, font_size, c_margin=0):
+        """Draw lines of text in the current font and fill colour, laid out like a
+        stack of FPDF cells of line_height at (x, y): one text object for all lines."""
+        if not lines:
+            return
+        # FPDF puts a cell's baseline at its vertical middle plus 0.3 of the font size
+        baseline = self.page_height - (y + line_height / 2 + 0.3 * font_size)
+        parts = [f'BT {x + c_margin:.2f} {baseline:.2f} Td ']
+        step = f' 0 {-line_height:.2f} Td '
+        parts.append(step.join(f'({ln.translate(_ESCAPES)}) Tj' for ln in lines))
+        parts.append(' ET\n')
+        self.buf += ''.join(parts).encode(self.encoding)
+
+    def write_to(self, pdf, page_no):
+        """Append the collected operators to page page_no (1-based) of the FPDF document."""
+        if self.buf:
+            contents = pdf.pages[page_no].contents
+            if contents and not contents.endswith(b'\n'):
+                contents += b'\n'
+            contents += self.buf
+            self.buf = bytearray()
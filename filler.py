@@ -0,0 +1,154 @@
+"""
+Exact-size filler made of real PDF objects.
+
+Null padding after %%EOF is skipped by most parsers, so it does not exercise
+them. In 'objects' mode the file is instead grown with an incremental update
+that embeds an incompressible attachment: an EmbeddedFile stream of random
+bytes, its Filespec, an EmbeddedFiles name tree and the updated catalog (or
+Names dictionary), followed by an xref section and trailer. The stream length
+is computed in closed form from the target size, so the result is exactly the
+target with no trial writes, and the random data is produced in chunks so
+multi-GB targets stay within a small, fixed amount of memory.
+
+When the file cannot take an update (target too close to the current size,
+an existing attachment tree, an xref stream layout) the caller gets plain
+null padding instead, which also lands exactly on the target.
+"""
+
+import os
+import random
+
+import fitz  # PyMuPDF
+
+from padding import PAD_CHUNK_SIZE, iter_padded, padding_needed, write_padding
+from pdf_metadata import read_trailer
+
+PAD_MODES = ('null', 'objects')
+FILLER_NAME = 'filler.bin'
+
+
+def _updated_names_holder(pdf_bytes, root_gen, tree_ref):
+    """Return (obj_num, gen, new object text) of the object that must be rewritten
+    so the catalog's /Names/EmbeddedFiles points at tree_ref."""
+    with fitz.open('pdf', pdf_bytes) as doc:
+        root = doc.pdf_catalog()
+        kind, value = doc.xref_get_key(root, 'Names')
+        if kind == 'xref':
+            holder, gen, key = int(value.split()[0]), int(value.split()[1]), 'EmbeddedFiles'
+        elif kind in ('dict', 'null'):
+            holder, gen, key = root, root_gen, 'Names/EmbeddedFiles'
+        else:
+            raise ValueError('unsupported /Names entry')
+        if doc.xref_get_key(holder, key)[0] != 'null':
+            raise ValueError('document already has embedded files')
+        doc.xref_set_key(holder, key, tree_ref)
+        return holder, gen, doc.xref_object(holder, compressed=True)
+
+
+def _filler_layout(pdf_bytes, target_bytes):
+    """Work out the update: returns (head, stream_length, tail) such that
+    pdf_bytes + head + <stream_length random bytes> + tail is exactly target_bytes.
+    Raises ValueError if that is not possible."""
+    fields, prev_xref = read_trailer(pdf_bytes)
+    size = int(fields['Size'])
+    stream_num, spec_num, tree_num = size, size + 1, size + 2
+    root_gen = int(fields['Root'].split()[1])
+    holder, holder_gen, holder_obj = _updated_names_holder(pdf_bytes, root_gen, f'{tree_num} 0 R')
+    sep = b'' if pdf_bytes.endswith(b'\n') else b'\n'
+    start = len(pdf_bytes) + len(sep)
+
+    def build(length, slack):
+        head = f'{stream_num} 0 obj\n<</Type/EmbeddedFile/Length {length}>>\nstream\n'.encode('latin-1')
+        offsets = {stream_num: start}
+        pos = start + len(head) + length
+        objects = [b'\nendstream\nendobj\n']
+        pos += len(objects[0])
+        for num, text in (
+            (spec_num, f'<</Type/Filespec/F({FILLER_NAME})/UF({FILLER_NAME})/EF<</F {stream_num} 0 R>>{" " * slack}>>'),
+            (tree_num, f'<</Names[({FILLER_NAME}) {spec_num} 0 R]>>'),
+            (holder, holder_obj),
+        ):
+            gen = holder_gen if num == holder else 0
+            obj = f'{num} {gen} obj\n{text}\nendobj\n'.encode('latin-1')
+            offsets[num] = pos
+            objects.append(obj)
+            pos += len(obj)
+        trailer = [f'/Size {size + 3}', f"/Root {fields['Root'].decode('latin-1')}", f'/Prev {prev_xref}']
+        if 'Info' in fields:
+            trailer.append(f"/Info {int(fields['Info'][0])} {int(fields['Info'][1])} R")
+        if 'ID' in fields:
+            trailer.append(f"/ID {fields['ID'].decode('latin-1')}")
+        xref = (
+            'xref\n'
+            f'{holder} 1\n'
+            f'{offsets[holder]:010} {holder_gen:05} n \n'
+            f'{stream_num} 3\n'
+            + ''.join(f'{offsets[n]:010} 00000 n \n' for n in (stream_num, spec_num, tree_num))
+            + 'trailer\n<<\n' + '\n'.join(trailer) + '\n>>\n'
+            f'startxref\n{pos}\n%%EOF\n'
+        )
+        return sep + head, b''.join(objects) + xref.encode('latin-1')
+
+    # Size is base + length plus the extra digits of /Length and startxref as they
+    # grow, so only a few candidate lengths need checking; one byte of slack
+    # covers targets that fall on a digit boundary.
+    for slack in (0, 1):
+        head, tail = build(0, slack)
+        base = len(pdf_bytes) + len(head) + len(tail)
+        for extra_digits in range(0, 40):
+            length = target_bytes - base - extra_digits
+            if length < 0:
+                break
+            head, tail = build(length, slack)
+            if len(pdf_bytes) + len(head) + length + len(tail) == target_bytes:
+                return head, length, tail
+    raise ValueError('target too small for an object filler')
+
+
+def _iter_random(n, seed=None, chunk_size=PAD_CHUNK_SIZE):
+    # Seeded requests get reproducible filler; otherwise os.urandom
+    randbytes = random.Random(seed).randbytes if seed is not None else os.urandom
+    while n > 0:
+        chunk = min(n, chunk_size)
+        yield randbytes(chunk)
+        n -= chunk
+
+
+def iter_filled(pdf_bytes, target_bytes, mode='null', seed=None):
+    """Yield pdf_bytes grown to target_bytes with the given pad mode ('null' or 'objects')."""
+    if mode == 'objects' and padding_needed(len(pdf_bytes), target_bytes):
+        try:
+            head, length, tail = _filler_layout(bytes(pdf_bytes), target_bytes)
+        except (ValueError, RuntimeError) as e:
+            print(f'Warning: object filler not possible ({e}), using null padding')
+        else:
+            yield pdf_bytes
+            yield head
+            yield from _iter_random(length, seed)
+            yield tail
+            return
+    yield from iter_padded(pdf_bytes, target_bytes)
+
+
+def fill_file(path, target_bytes, mode='null', seed=None):
+    """Grow the PDF at path to target_bytes in place. Returns the number of bytes added."""
+    to_add = padding_needed(os.path.getsize(path), target_bytes)
+    if not to_add:
+        return 0
+    if mode == 'objects':
+        with open(path, 'rb') as f:
+            pdf_bytes = f.read()
+        try:
+            head, length, tail = _filler_layout(pdf_bytes, target_bytes)
+        except (ValueError, RuntimeError) as e:
+            print(f'Warning: object filler not possible ({e}), using null padding')
+        else:
+            with open(path, 'ab') as f:
+                f.write(head)
+                for chunk in _iter_random(length, seed):
+                    f.write(chunk)
+                f.write(tail)
+            return to_add
+    with open(path, 'ab') as f:
+        write_padding(f, to_add)
+    return to_add
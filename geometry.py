@@ -0,0 +1,105 @@
+"""
+Batched markup geometry.
+
+Outlines of the drawn shapes (revision-cloud bumps, pen polylines, measurement
+end markers) are computed for all the shapes of a page in one NumPy pass and
+written as one path operator per shape: a cloud is a single path of circle
+subpaths stroked once, rather than one ellipse call and stroke per bump. The
+operators are formatted with one %-format call per shape, so the per-bump
+Python overhead and the repeated graphics operators both go away.
+
+Coordinates come in the generators' layout space (origin top-left, as FPDF
+uses) and are flipped to PDF space with the page height when formatted.
+"""
+
+import numpy as np
+
+# Control point distance of a cubic Bezier quarter circle
+KAPPA = 4 / 3 * (np.sqrt(2) - 1)
+
+CLOUD_BUMP = 8  # bump diameter
+
+_CIRCLE_OPS = '%.2f %.2f m %.2f %.2f %.2f %.2f %.2f %.2f c %.2f %.2f %.2f %.2f %.2f %.2f c ' \
+              '%.2f %.2f %.2f %.2f %.2f %.2f c %.2f %.2f %.2f %.2f %.2f %.2f c '
+
+
+def _ranges(counts):
+    # (owner, i) for i in range(counts[owner]) for every owner, without a Python loop
+    owner = np.repeat(np.arange(len(counts)), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.arange(owner.size) - starts
+
+
+def cloud_bumps(rects, r=CLOUD_BUMP):
+    """Bump centres of the revision clouds around rects, an (N, 4) array of
+    (x, y, w, h). Returns (owner, cx, cy) sorted by owner, the rect index of each bump."""
+    rects = np.asarray(rects, dtype=float).reshape(-1, 4)
+    x, y, w, h = rects.T
+    # bumps along the top and bottom edges, then down the left and right edges
+    n_h = np.maximum(8, (w / 30).astype(int))
+    owner_h, i_h = _ranges(n_h)
+    cx_h = x[owner_h] + r + i_h * ((w - 2 * r) / n_h)[owner_h]
+    n_v = np.maximum(4, (h / 24).astype(int))
+    owner_v, i_v = _ranges(n_v)
+    cy_v = y[owner_v] + r + i_v * ((h - 2 * r) / n_v)[owner_v]
+    owner = np.concatenate([owner_h, owner_h, owner_v, owner_v])
+    cx = np.concatenate([cx_h, cx_h, x[owner_v], (x + w)[owner_v]])
+    cy = np.concatenate([y[owner_h], (y + h)[owner_h], cy_v, cy_v])
+    order = np.argsort(owner, kind='stable')
+    return owner[order], cx[order], cy[order]
+
+
+def circle_points(cx, cy, radius, page_height):
+    """(M, 26) array: for each circle the moveto point and the three points of each
+    of its four Bezier curves, in PDF space."""
+    cx = np.asarray(cx, dtype=float)
+    cy = page_height - np.asarray(cy, dtype=float)
+    k = KAPPA * radius
+    # offsets from the centre, counter-clockwise from the rightmost point
+    dx = np.array([radius, radius, k, 0, -k, -radius, -radius, -radius, -k, 0, k, radius, radius])
+    dy = np.array([0, k, radius, radius, radius, k, 0, -k, -radius, -radius, -radius, -k, 0])
+    pts = np.empty((cx.size, 13, 2))
+    pts[:, :, 0] = cx[:, None] + dx
+    pts[:, :, 1] = cy[:, None] + dy
+    return pts.reshape(cx.size, 26)
+
+
+def cloud_paths(rects, page_height, r=CLOUD_BUMP):
+    """Path operators for revision clouds around rects: one stroked path per cloud."""
+    if not len(rects):
+        return []
+    owner, cx, cy = cloud_bumps(rects, r)
+    points = circle_points(cx, cy, r / 2, page_height)
+    bounds = np.searchsorted(owner, np.arange(len(rects) + 1))
+    paths = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        paths.append((_CIRCLE_OPS * (end - start)) % tuple(points[start:end].ravel().tolist()) + 'S')
+    return paths
+
+
+def polyline_paths(polylines, page_height):
+    """Path operators for polylines (lists of (x, y) points): one stroked path each."""
+    if not polylines:
+        return []
+    counts = np.array([len(p) for p in polylines])
+    points = np.array([pt for p in polylines for pt in p], dtype=float).reshape(-1, 2)
+    points[:, 1] = page_height - points[:, 1]
+    flat = points.ravel().tolist()
+    paths, pos = [], 0
+    for n in counts.tolist():
+        ops = '%.2f %.2f m ' + '%.2f %.2f l ' * (n - 1) + 'S'
+        paths.append(ops % tuple(flat[pos:pos + 2 * n]))
+        pos += 2 * n
+    return paths
+
+
+def measurement_segments(lines, marker_size=5):
+    """Segments of measurement lines: for an (N, 4) array of (x1, y1, x2, y2),
+    an (N, 5, 4) array of the line itself and the two strokes of an X marker at
+    each end."""
+    lines = np.asarray(lines, dtype=float).reshape(-1, 4)
+    m = marker_size
+    ends = lines.reshape(-1, 2, 2)  # (N, end, xy)
+    cross = np.array([[-m, -m, m, m], [-m, m, m, -m]])  # the two strokes of an X
+    markers = np.tile(ends, (1, 1, 2))[:, :, None, :] + cross  # (N, end, stroke, 4)
+    return np.concatenate([lines[:, None, :], markers.reshape(-1, 4, 4)], axis=1)
@@ -0,0 +1,28 @@
+"""
+gunicorn settings for production serving (gunicorn -c gunicorn.conf.py wsgi:app).
+
+Concurrency is workers x threads. Generation is CPU-bound and holds the GIL,
+so add workers (processes) for throughput and threads to keep workers busy
+while requests upload, stream or wait on I/O. Environment variables:
+
+  PDFGEN_BIND      address to listen on (default 0.0.0.0:5000)
+  PDFGEN_WORKERS   worker processes (default: number of CPUs)
+  PDFGEN_THREADS   threads per worker (default 4)
+  PDFGEN_TIMEOUT   seconds before a stuck worker is restarted (default 300)
+"""
+
+import os
+
+bind = os.environ.get('PDFGEN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('PDFGEN_WORKERS', os.cpu_count() or 1))
+threads = int(os.environ.get('PDFGEN_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('PDFGEN_TIMEOUT', '300'))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app (and warm it up) once in the master, then fork
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
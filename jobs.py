@@ -0,0 +1,124 @@
+"""
+In-process background job queue for long-running PDF generation.
+
+Jobs run on a bounded thread pool. Admission is limited both globally (running
+plus queued jobs) and per client, so a few huge requests cannot starve everyone
+else; rejected submissions raise JobRejected. Each job writes its result to a
+file in the manager's result directory and reports progress (pages done, bytes
+written) while it runs. Finished jobs and their files are dropped after a TTL.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobRejected(Exception):
+    """Raised when a job cannot be admitted (queue full or client over its limit)."""
+
+
+class Job:
+    def __init__(self, job_id, client, filename, result_path):
+        self.id = job_id
+        self.client = client
+        self.filename = filename
+        self.result_path = result_path
+        self.status = 'queued'
+        self.error = None
+        self.pages_done = 0
+        self.pages_total = None
+        self.bytes_written = 0
+        self.bytes_total = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.extra = {}  # job-specific details reported with the status
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def report_pages(self, done, total):
+        self.pages_done, self.pages_total = done, total
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'bytes_written': self.bytes_written,
+            'bytes_total': self.bytes_total,
+            'filename': self.filename,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            **self.extra,
+        }
+
+
+class JobManager:
+    def __init__(self, workers=2, max_pending=16, max_per_client=2, result_dir=None, ttl=3600):
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self.ttl = ttl
+        self.result_dir = result_dir or tempfile.mkdtemp(prefix='pdf_jobs_')
+        os.makedirs(self.result_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, client=None, filename='generated_document.pdf'):
+        """Queue fn(job) to run in the background and return the Job.
+        fn must write the result to job.result_path; its progress fields may be updated as it goes."""
+        self._expire()
+        with self._lock:
+            active = [j for j in self._jobs.values() if j.active]
+            if len(active) >= self.max_pending:
+                raise JobRejected('Too many jobs queued, try again later')
+            if client is not None and sum(1 for j in active if j.client == client) >= self.max_per_client:
+                raise JobRejected('Too many active jobs for this client')
+            job_id = uuid.uuid4().hex
+            job = Job(job_id, client, filename, os.path.join(self.result_dir, f'{job_id}.pdf'))
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            fn(job)
+            job.status = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            job.status = 'failed'
+            job.error = str(e)
+            if os.path.exists(job.result_path):
+                os.unlink(job.result_path)
+        finally:
+            job.finished = time.time()
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [j for j in self._jobs.values() if j.finished and now - j.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            if os.path.exists(job.result_path):
+                os.unlink(job.result_path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self.result_dir, ignore_errors=True)
@@ -0,0 +1,54 @@
+"""
+Chunked size padding shared by the web app and the CLI script.
+
+Padding is never built as one big ``b'\\0' * n`` buffer; it is produced in
+fixed-size chunks so multi-GB targets keep memory near the size of the real PDF.
+"""
+
+import os
+
+PAD_CHUNK_SIZE = 1024 * 1024  # 1 MB of filler per write/yield
+_ZERO_CHUNK = bytes(PAD_CHUNK_SIZE)
+
+
+def padding_needed(actual_bytes, target_bytes):
+    """Number of filler bytes needed to reach target_bytes (0 if already larger)."""
+    if not target_bytes:
+        return 0
+    return max(0, int(target_bytes) - int(actual_bytes))
+
+
+def iter_padding(pad_bytes, chunk_size=PAD_CHUNK_SIZE):
+    """Yield pad_bytes of null filler in chunks of at most chunk_size."""
+    chunk = _ZERO_CHUNK if chunk_size == PAD_CHUNK_SIZE else bytes(chunk_size)
+    remaining = pad_bytes
+    while remaining >= chunk_size:
+        yield chunk
+        remaining -= chunk_size
+    if remaining > 0:
+        yield chunk[:remaining]
+
+
+def iter_padded(data, target_bytes, chunk_size=PAD_CHUNK_SIZE):
+    """Yield the real PDF bytes followed by null filler up to target_bytes."""
+    yield data
+    yield from iter_padding(padding_needed(len(data), target_bytes), chunk_size)
+
+
+def write_padding(f, pad_bytes, chunk_size=PAD_CHUNK_SIZE):
+    """Append pad_bytes of null filler to an open binary file object."""
+    written = 0
+    for chunk in iter_padding(pad_bytes, chunk_size):
+        f.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def pad_file(path, target_bytes, chunk_size=PAD_CHUNK_SIZE):
+    """Pad the file at path with null bytes up to target_bytes.
+    Returns the number of bytes appended (0 if the file is already big enough)."""
+    to_pad = padding_needed(os.path.getsize(path), target_bytes)
+    if to_pad:
+        with open(path, 'ab') as f:
+            write_padding(f, to_pad, chunk_size)
+    return to_pad
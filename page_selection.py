@@ -0,0 +1,85 @@
+"""
+Page selection for large source documents.
+
+A selection spec picks source pages by their 1-based numbers, as a viewer
+shows them:
+
+  "1-10,15,40-"     pages and ranges (an open end runs to the last page)
+  "1-2000:50"       a range with a stride (every 50th page)
+  "random:25"       25 distinct pages sampled at random, kept in document order
+
+Terms can be combined ("1-3,random:10"). page_plan() turns a spec plus the
+requested page count into the source page of every output page; only those
+pages are ever loaded, so cutting a 2,000-sheet set down to a few pages costs
+time proportional to the pages kept. When more pages are requested than were
+selected, the selection is repeated and the generators reuse the first copy
+(same rendered image / same page XObject) instead of rendering it again.
+"""
+
+import random
+import re
+
+_RANGE = re.compile(r'^(\d+)?\s*(?:(-)\s*(\d+)?)?\s*(?::\s*(\d+))?$')
+_RANDOM = re.compile(r'^random\s*:\s*(\d+)$')
+
+
+def parse_spec(spec):
+    """Parse a selection spec into terms: ('range', first, last, step) with 1-based
+    inclusive bounds (last None = open end) or ('random', n). Raises ValueError."""
+    terms = []
+    for part in (spec or '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        m = _RANDOM.match(part)
+        if m:
+            terms.append(('random', int(m.group(1))))
+            continue
+        m = _RANGE.match(part)
+        if not m or not (m.group(1) or m.group(2)):
+            raise ValueError(f'Invalid page selection: {part!r}')
+        first = int(m.group(1) or 1)
+        last = first if not m.group(2) else (int(m.group(3)) if m.group(3) else None)
+        step = int(m.group(4) or 1)
+        if first < 1 or step < 1 or (last is not None and last < first):
+            raise ValueError(f'Invalid page selection: {part!r}')
+        terms.append(('range', first, last, step))
+    if not terms:
+        raise ValueError('Empty page selection')
+    return terms
+
+
+def select_pages(spec, total, rng=random):
+    """0-based source page indexes picked by spec (a string or parse_spec() terms)
+    from a document of total pages. Pages past the end are ignored."""
+    terms = parse_spec(spec) if isinstance(spec, str) else spec
+    selected = []
+    for term in terms:
+        if term[0] == 'random':
+            n = min(term[1], total)
+            selected.extend(sorted(rng.sample(range(total), n)))
+        else:
+            _, first, last, step = term
+            last = total if last is None else min(last, total)
+            selected.extend(range(first - 1, last, step))
+    return selected
+
+
+def page_plan(total, page_count=None, pages=None, seed=None):
+    """Source page index for each output page (None for a blank page when the
+    source has no pages). pages is a selection spec (default: every page);
+    page_count defaults to the number of selected pages, and a larger count
+    repeats the selection."""
+    if pages:
+        # Its own RNG, so sampling pages does not shift the comment placement
+        selected = select_pages(pages, total, random.Random(f'{seed}:pages'))
+        if not selected:
+            raise ValueError('The page selection matches no pages of the document')
+    else:
+        selected = range(total)
+    if page_count is None:
+        page_count = len(selected)
+    if not selected:
+        return [None] * page_count
+    n = len(selected)
+    return [selected[i % n] for i in range(page_count)]
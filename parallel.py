@@ -0,0 +1,55 @@
+"""
+Helpers for fanning independent page drawing out across processes.
+
+Every page gets its own random.Random seeded from (document seed, page number),
+so a run with workers=N draws exactly the same markups as the serial run.
+"""
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+
+def new_seed():
+    """Pick a fresh document seed when the caller did not supply one."""
+    return random.randrange(2**32)
+
+
+def page_rng(seed, page_num):
+    """Private RNG for one page; depends only on the document seed and page number."""
+    return random.Random(f'{seed}:{page_num}')
+
+
+def resolve_workers(workers):
+    """Normalize a workers option: None/0 -> 1, negative -> all CPUs."""
+    if not workers:
+        return 1
+    workers = int(workers)
+    if workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def split_pages(page_nums, parts):
+    """Split page numbers into at most `parts` contiguous, near-equal chunks."""
+    page_nums = list(page_nums)
+    parts = max(1, min(parts, len(page_nums)))
+    size, extra = divmod(len(page_nums), parts)
+    chunks, start = [], 0
+    for n in range(parts):
+        end = start + size + (1 if n < extra else 0)
+        chunks.append(page_nums[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+def map_pages(fn, tasks, workers=1):
+    """Run fn over tasks (in order) serially or on a process pool of `workers` processes.
+    fn and tasks must be picklable when workers > 1."""
+    tasks = list(tasks)
+    workers = min(resolve_workers(workers), len(tasks))
+    if workers <= 1:
+        return [fn(task) for task in tasks]
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, tasks, chunksize=chunksize))
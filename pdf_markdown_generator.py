@@ -3,19 +3,27 @@ import random
 import fitz  # PyMuPDF
 from fpdf import FPDF
 from datetime import datetime
+from rendering import DEFAULT_RENDER, PageBackgrounds, document_digest
+from page_selection import page_plan
+from compression import compression_level, fpdf_compress
 
 class PDFMarkdownGenerator:
-    def __init__(self, input_pdf_path, output_dir='output'):
+    def __init__(self, input_pdf_path, output_dir='output', compression='default', pages=None, seed=None,
+                 render_settings=DEFAULT_RENDER):
         self.input_pdf_path = input_pdf_path
         self.output_dir = output_dir
+        self.compression = compression  # one of compression.COMPRESSION_MODES
+        self.render_settings = render_settings  # rendering.RenderSettings of the backgrounds
         self.markdown_content = []
         self.current_page = 0
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Load the PDF
+        # Open the PDF; pages are only loaded when they are drawn
         self.doc = fitz.open(input_pdf_path)
+        # Source pages used as backgrounds, in order (a page_selection spec, default all)
+        self.selection = page_plan(len(self.doc), pages=pages, seed=seed)
         
     def add_markdown(self, content):
         """Add markdown content to the current page."""
@@ -27,6 +35,11 @@ class PDFMarkdownGenerator:
         """Move to a new page."""
         self.current_page += 1
     
+    def source_page(self, page_num):
+        """Source page index behind output page page_num (the last selected page
+        is reused past the end of the selection)."""
+        return self.selection[min(page_num, len(self.selection) - 1)]
+    
     def generate_pdf(self, output_filename=None):
         """Generate PDF with markdown overlaid on the background PDF."""
         if not output_filename:
@@ -34,30 +47,29 @@ class PDFMarkdownGenerator:
             output_filename = f"generated_{timestamp}.pdf"
         output_path = os.path.join(self.output_dir, output_filename)
         
-        # Create a temporary directory for page images
-        temp_dir = os.path.join(self.output_dir, 'temp_pages')
-        os.makedirs(temp_dir, exist_ok=True)
-        
         # Create a new PDF with the same dimensions as the original
         pdf = FPDF()
+        pdf.set_compression(fpdf_compress(self.compression))
+        
+        # Rendered pages are cached by source digest, and a source page used again
+        # refers to the image embedded the first time
+        page_nums = range(max(len(self.markdown_content), 1))  # At least one page
+        backgrounds = PageBackgrounds(self.doc, [self.source_page(n) for n in page_nums],
+                                      document_digest(self.doc), self.render_settings)
         
         # Process each page
-        for page_num in range(max(len(self.markdown_content), 1)):  # At least one page
+        for page_num in page_nums:
             # Get the corresponding page from the original PDF
-            src_page_num = min(page_num, len(self.doc) - 1)  # Reuse last page if needed
-            page = self.doc[src_page_num]
-            width, height = page.rect.width, page.rect.height
-            
-            # Render the page as an image
-            pix = page.get_pixmap()
-            img_path = os.path.join(temp_dir, f'page_{page_num}.png')
-            pix.save(img_path)
+            src_page_num = self.source_page(page_num)  # Reuse last page if needed
+            rect = self.doc.load_page(src_page_num).rect
+            width, height = rect.width, rect.height
             
             # Add a page with the same dimensions as the original
             pdf.add_page(format=(width, height))
             
-            # Add background image
-            pdf.image(img_path, x=0, y=0, w=width, h=height)
+            # Render the page and add it as the background image (kept in memory)
+            with compression_level(self.compression):
+                backgrounds.draw(pdf, src_page_num, width, height)
             
             # Add markdown content if it exists for this page
             if page_num < len(self.markdown_content) and self.markdown_content[page_num].strip():
@@ -85,27 +97,21 @@ class PDFMarkdownGenerator:
                     if y_position > height - 50 and page_num < len(self.markdown_content) - 1:
                         # Save current page and start a new one
                         page_num += 1
-                        src_page_num = min(page_num, len(self.doc) - 1)
-                        page = self.doc[src_page_num]
-                        width, height = page.rect.width, page.rect.height
-                        
-                        # Render the new page as an image
-                        pix = page.get_pixmap()
-                        img_path = os.path.join(temp_dir, f'page_{page_num}.png')
-                        pix.save(img_path)
+                        src_page_num = self.source_page(page_num)
+                        rect = self.doc.load_page(src_page_num).rect
+                        width, height = rect.width, rect.height
                         
-                        # Add new page with background
+                        # Add new page with the rendered background
                         pdf.add_page(format=(width, height))
-                        pdf.image(img_path, x=0, y=0, w=width, h=height)
+                        with compression_level(self.compression):
+                            backgrounds.draw(pdf, src_page_num, width, height)
                         y_position = 50
         
-        # Clean up temporary files
-        for file in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, file))
-        os.rmdir(temp_dir)
+        backgrounds.close()
         
         # Save the PDF
-        pdf.output(output_path)
+        with compression_level(self.compression):
+            pdf.output(output_path)
         return output_path
 
 def generate_sample_markdown():
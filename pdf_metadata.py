@@ -0,0 +1,221 @@
+"""
+Document metadata (Info dictionary) stamping.
+
+Metadata is written as a PDF incremental update appended to the existing bytes:
+a new Info object, a one-entry xref section and a trailer pointing back to the
+previous xref with /Prev. Only the trailer and the old Info object are read, so
+the cost does not depend on the number of pages. Files whose last section is an
+xref stream (not produced by our generators) fall back to a full PyPDF2 rewrite.
+"""
+
+import io
+import re
+
+from PyPDF2 import PdfReader, PdfWriter
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)\s*%%EOF\s*$')
+_SUBSECTION_RE = re.compile(rb'(\d+)[ \t]+(\d+)[ \t]*\r?\n')
+_TRAILER_KEYS_RE = {
+    'Size': re.compile(rb'/Size\s+(\d+)'),
+    'Root': re.compile(rb'/Root\s+(\d+\s+\d+\s+R)'),
+    'Info': re.compile(rb'/Info\s+(\d+)\s+(\d+)\s+R'),
+    'Prev': re.compile(rb'/Prev\s+(\d+)'),
+    'ID': re.compile(rb'/ID\s*(\[[^\]]*\])'),
+}
+_NAME_RE = re.compile(rb'/[^\s/<>\[\]()]+')
+_TOKEN_RE = re.compile(rb'[^\s/<>\[\]()]+(?:\s+\d+\s+R)?')  # number, boolean or reference
+_XREF_ENTRY_SIZE = 20  # every xref table entry is exactly 20 bytes
+
+
+def pdf_date(dt):
+    """Format a date/datetime as a PDF date string (D:YYYYMMDDHHmmSS)."""
+    return f"D:{dt.strftime('%Y%m%d%H%M%S')}"
+
+
+def pdf_string(value):
+    """Serialize a Python string as a PDF text string."""
+    try:
+        raw = value.encode('latin-1')
+    except UnicodeEncodeError:
+        return '<FEFF' + value.encode('utf-16-be').hex().upper() + '>'
+    escaped = raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return '(' + escaped.decode('latin-1') + ')'
+
+
+def _parse_trailer(data, xref_offset):
+    """Return (trailer fields, xref table start) for the classic xref section at xref_offset."""
+    if data[xref_offset:xref_offset + 4] != b'xref':
+        raise ValueError('last cross-reference section is not an xref table')
+    trailer_at = data.find(b'trailer', xref_offset)
+    if trailer_at < 0:
+        raise ValueError('trailer not found')
+    end = data.find(b'startxref', trailer_at)
+    trailer = data[trailer_at:end if end > 0 else len(data)]
+    fields = {}
+    for key, regex in _TRAILER_KEYS_RE.items():
+        m = regex.search(trailer)
+        if m:
+            fields[key] = m.groups() if key == 'Info' else m.group(1)
+    return fields, trailer_at
+
+
+def read_trailer(data):
+    """Return (trailer fields, offset of the last xref section) for appending an
+    incremental update. Fields are raw bytes: Size, Root ('n g R'), Info
+    ((num, gen)), Prev and ID when present. Raises ValueError for layouts we
+    cannot append to (e.g. a final xref stream)."""
+    m = _STARTXREF_RE.search(data[-1024:])
+    if not m:
+        raise ValueError('startxref not found')
+    last_xref = int(m.group(1))
+    fields, _ = _parse_trailer(data, last_xref)
+    if 'Size' not in fields or 'Root' not in fields:
+        raise ValueError('incomplete trailer')
+    return fields, last_xref
+
+
+def _find_object_offset(data, xref_offset, obj_num):
+    """Look up obj_num in the xref table chain starting at xref_offset."""
+    while xref_offset is not None:
+        fields, trailer_at = _parse_trailer(data, xref_offset)
+        pos = xref_offset + 4
+        while True:
+            while data[pos:pos + 1] in (b'\r', b'\n', b' '):
+                pos += 1
+            m = _SUBSECTION_RE.match(data, pos)
+            if not m or pos >= trailer_at:
+                break
+            start, count = int(m.group(1)), int(m.group(2))
+            pos = m.end()
+            if start <= obj_num < start + count:
+                entry = data[pos + (obj_num - start) * _XREF_ENTRY_SIZE:][:_XREF_ENTRY_SIZE]
+                if entry[17:18] == b'n':
+                    return int(entry[:10])
+                return None
+            pos += count * _XREF_ENTRY_SIZE
+        xref_offset = int(fields['Prev']) if 'Prev' in fields else None
+    return None
+
+
+def _read_literal_string(data, pos):
+    depth, i = 0, pos
+    while i < len(data):
+        ch = data[i:i + 1]
+        if ch == b'\\':
+            i += 2
+            continue
+        if ch == b'(':
+            depth += 1
+        elif ch == b')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise ValueError('unterminated string')
+
+
+def _parse_info_entries(data, offset):
+    """Parse the flat Info dictionary of the object at offset into {'/Key': raw value}."""
+    start = data.find(b'<<', offset)
+    entries = {}
+    pos = start + 2
+    while True:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 2] == b'>>':
+            return entries
+        if data[pos:pos + 1] != b'/':
+            raise ValueError('unexpected token in Info dictionary')
+        m = _NAME_RE.match(data, pos)
+        key = m.group(0).decode('latin-1')
+        pos = m.end()
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        lead = data[pos:pos + 1]
+        if data[pos:pos + 2] == b'<<':
+            raise ValueError('nested dictionary in Info')
+        if lead == b'(':
+            end = _read_literal_string(data, pos)
+        elif lead == b'<':
+            end = data.index(b'>', pos) + 1
+        elif lead == b'[':
+            end = data.index(b']', pos) + 1
+        elif lead == b'/':
+            end = _NAME_RE.match(data, pos).end()
+        else:
+            end = _TOKEN_RE.match(data, pos).end()
+        entries[key] = data[pos:end].decode('latin-1')
+        pos = end
+
+
+def build_info_update(pdf_bytes, metadata):
+    """Return the incremental update (bytes to append to pdf_bytes) that sets the
+    given Info entries. metadata maps PDF keys ('/ModDate', '/Title', custom
+    '/Keys') to string values; existing entries that are not overridden are kept.
+    Raises ValueError if the file layout is not supported."""
+    data = pdf_bytes
+    fields, prev_xref = read_trailer(data)
+
+    entries = {}
+    if 'Info' in fields:
+        info_offset = _find_object_offset(data, prev_xref, int(fields['Info'][0]))
+        if info_offset is not None:
+            entries = _parse_info_entries(data, info_offset)
+    for key, value in metadata.items():
+        key = key if key.startswith('/') else '/' + key
+        entries[key] = pdf_string(str(value))
+
+    info_num = int(fields['Size'])
+    body = ''.join(f'{k} {v}\n' for k, v in entries.items())
+    out = io.BytesIO()
+    if not data.endswith(b'\n'):
+        out.write(b'\n')
+    info_offset = len(data) + out.tell()
+    out.write(f'{info_num} 0 obj\n<<\n{body}>>\nendobj\n'.encode('latin-1'))
+    xref_offset = len(data) + out.tell()
+    trailer = [f'/Size {info_num + 1}', f"/Root {fields['Root'].decode('latin-1')}",
+               f'/Info {info_num} 0 R', f'/Prev {prev_xref}']
+    if 'ID' in fields:
+        trailer.append(f"/ID {fields['ID'].decode('latin-1')}")
+    out.write((
+        'xref\n'
+        f'{info_num} 1\n'
+        f'{info_offset:010} 00000 n \n'
+        'trailer\n'
+        '<<\n' + '\n'.join(trailer) + '\n>>\n'
+        'startxref\n'
+        f'{xref_offset}\n'
+        '%%EOF\n'
+    ).encode('latin-1'))
+    return out.getvalue()
+
+
+def append_info_update(pdf_bytes, metadata):
+    """Return pdf_bytes followed by the incremental update from build_info_update()."""
+    return bytes(pdf_bytes) + build_info_update(bytes(pdf_bytes), metadata)
+
+
+def rewrite_info(pdf_bytes, metadata):
+    """Fallback: copy the document through PyPDF2 with updated metadata (O(document))."""
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    for p in reader.pages:
+        writer.add_page(p)
+    # Preserve existing metadata and override the requested keys
+    meta = {} if reader.metadata is None else dict(reader.metadata)
+    for key, value in metadata.items():
+        meta[key if key.startswith('/') else '/' + key] = value
+    writer.add_metadata(meta)
+    out_bio = io.BytesIO()
+    writer.write(out_bio)
+    return out_bio.getvalue()
+
+
+def set_pdf_metadata(pdf_bytes, metadata):
+    """Set Info entries on a generated PDF, preferring the O(1) incremental update."""
+    if not metadata:
+        return pdf_bytes
+    try:
+        return append_info_update(pdf_bytes, metadata)
+    except ValueError:
+        return rewrite_info(pdf_bytes, metadata)
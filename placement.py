@@ -0,0 +1,91 @@
+"""
+Collision-free placement of markup boxes on a page.
+
+PlacementGrid indexes placed rectangles in a uniform grid of buckets, so an
+overlap check only looks at boxes in the buckets the candidate covers instead
+of every box on the page. Placement first tries a few random positions (the
+original look); if they all collide it falls back to a bottom-left scan. Any
+free spot can be slid up and then left until it touches the margin or a placed
+box, so it is enough to try the rows at the top margin and at the bottom edge
+of every placed box, walking each row left to right and jumping past whatever
+box is in the way. The scan is exhaustive: a comment is only reported as not
+fitting when no free spot exists for it.
+"""
+
+import bisect
+import random
+
+
+class PlacementGrid:
+    """Spatial index of placed (x, y, w, h) boxes within the page margins."""
+
+    def __init__(self, width, height, margin=0, cell_size=128, row_step=8):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.cell_size = cell_size
+        self.row_step = row_step
+        self.boxes = []
+        self._cells = {}  # (col, row) -> indexes into self.boxes
+        # Candidate rows of the fallback scan: the top margin and placed boxes' bottom edges
+        self._rows = [margin]
+
+    def _cell_range(self, rect):
+        x, y, w, h = rect
+        cs = self.cell_size
+        return range(int(x // cs), int((x + w) // cs) + 1), range(int(y // cs), int((y + h) // cs) + 1)
+
+    def blocker(self, rect):
+        """Return the first placed box overlapping rect, or None if rect is free."""
+        x1, y1, w1, h1 = rect
+        cols, rows = self._cell_range(rect)
+        boxes = self.boxes
+        for col in cols:
+            for row in rows:
+                for idx in self._cells.get((col, row), ()):
+                    x2, y2, w2, h2 = boxes[idx]
+                    if not (x1 + w1 <= x2 or x2 + w2 <= x1 or y1 + h1 <= y2 or y2 + h2 <= y1):
+                        return boxes[idx]
+        return None
+
+    def is_free(self, rect):
+        return self.blocker(rect) is None
+
+    def insert(self, rect):
+        idx = len(self.boxes)
+        self.boxes.append(rect)
+        cols, rows = self._cell_range(rect)
+        for col in cols:
+            for row in rows:
+                self._cells.setdefault((col, row), []).append(idx)
+        bottom = rect[1] + rect[3]
+        i = bisect.bisect_left(self._rows, bottom)
+        if i == len(self._rows) or self._rows[i] != bottom:
+            self._rows.insert(i, bottom)
+
+    def place(self, w, h, rng=random, tries=25):
+        """Find a free spot for a w x h box, record it and return (x, y); None if the page is full."""
+        max_x = max(self.margin, self.width - self.margin - w)
+        max_y = max(self.margin, self.height - self.margin - h)
+        for _ in range(tries):
+            x = rng.uniform(self.margin, max_x)
+            y = rng.uniform(self.margin, max_y)
+            if self.is_free((x, y, w, h)):
+                self.insert((x, y, w, h))
+                return x, y
+        return self._scan(w, h, max_x, max_y)
+
+    def _scan(self, w, h, max_x, max_y):
+        # Bottom-left fallback: every candidate row, left to right, skipping past blockers
+        for y in self._rows:
+            if y > max_y:
+                break
+            x = self.margin
+            while x <= max_x:
+                rect = (x, y, w, h)
+                hit = self.blocker(rect)
+                if hit is None:
+                    self.insert(rect)
+                    return x, y
+                x = hit[0] + hit[2]
+        return None
@@ -0,0 +1,95 @@
+"""
+Optional per-stage timing and memory instrumentation for the generation pipeline.
+
+A SpanRecorder is threaded through the generators; each stage runs inside
+``with recorder.span('name'):``. Spans with the same name (e.g. one render per
+page) are aggregated. When memory tracing is on, each span also records the
+tracemalloc peak reached while it ran. NULL_RECORDER has the same interface
+and does nothing, so the instrumentation costs almost nothing when disabled.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_NULL_SPAN = nullcontext()
+
+
+class NullRecorder:
+    enabled = False
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def summary(self):
+        return {}
+
+
+NULL_RECORDER = NullRecorder()
+
+
+class SpanRecorder:
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.spans = {}  # name -> {'ms': total, 'count': n, 'peak_bytes': max}
+        self._stack = []  # running peak of each open span when tracing memory
+
+    @contextmanager
+    def span(self, name):
+        if self.trace_memory:
+            if self._stack:
+                # Remember the parent's peak so far before resetting for this span
+                self._stack[-1] = max(self._stack[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._stack.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            peak = None
+            if self.trace_memory:
+                peak = max(self._stack.pop(), tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1] = max(self._stack[-1], peak)
+            entry = self.spans.get(name)
+            if entry is None:
+                entry = self.spans[name] = {'ms': 0.0, 'count': 0, 'peak_bytes': None}
+            entry['ms'] += elapsed_ms
+            entry['count'] += 1
+            if peak is not None:
+                entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak)
+
+    def summary(self):
+        return {
+            name: {
+                'ms': round(entry['ms'], 3),
+                'count': entry['count'],
+                'peak_bytes': entry['peak_bytes'],
+            }
+            for name, entry in self.spans.items()
+        }
+
+    def server_timing(self):
+        """Format the spans as a Server-Timing header value."""
+        parts = []
+        for name, entry in self.spans.items():
+            part = f"{name};dur={entry['ms']:.1f}"
+            desc = []
+            if entry['count'] > 1:
+                desc.append(f"x{entry['count']}")
+            if entry['peak_bytes'] is not None:
+                desc.append(f"peak {entry['peak_bytes'] / (1024 * 1024):.1f}MB")
+            if desc:
+                part += f';desc="{" ".join(desc)}"'
+            parts.append(part)
+        return ', '.join(parts)
+
+    def log_line(self, **fields):
+        """One structured (JSON) log line with the given request fields and the spans."""
+        return json.dumps({**fields, 'spans': self.summary()}, sort_keys=True)
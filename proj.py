@@ -12,12 +12,20 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from PyPDF2 import PdfMerger
+from filler import fill_file
+from compression import compression_level, reportlab_page_compression
+from parallel import map_pages, new_seed, page_rng, resolve_workers, split_pages
 
 # ─── CONFIG ────────────────────────────────────────────────────────────────────
 TARGET_SIZE_MB = 1500        # ← Change this to whatever MB size you need (e.g. 1500 for ~1.5 GB)
 PAGES = 20                   # ← Number of distinct pages to generate
 TEMP_DIR = "tmp_pages"
 OUTPUT_PDF = "test_pdf_exact_size.pdf"
+WORKERS = 1                  # ← Processes used to draw pages (-1 = all CPUs)
+SEED = None                  # ← Set to an int for reproducible markups
+COMPRESSION = "none"         # ← "none", "fast" (zlib 1) or "max" (zlib 9) for page content streams
+PAD_MODE = "null"            # ← "null" = trailing null bytes, "objects" = embedded random-data attachment
+TIMESTAMP = None             # ← Set to a datetime to fix the PDF dates/ID (byte-identical reruns with SEED)
 # ────────────────────────────────────────────────────────────────────────────────
 
 # Sample “realistic” AEC comments
@@ -52,17 +60,16 @@ def draw_diamond(c, x, y, size=12):
     c.setLineWidth(1)
     c.drawPath(p, stroke=1, fill=1)
 
-def draw_page(page_num, path):
-    c = canvas.Canvas(path, pagesize=(PAGE_WIDTH, PAGE_HEIGHT), pageCompression=0)
+def draw_page_content(c, page_num, rng=random):
     # Random boxes + text
-    count = random.randint(5, 10)
+    count = rng.randint(5, 10)
     for i in range(count):
-        comment = random.choice(COMMENTS)
-        clr     = random.choice(COLORS)
+        comment = rng.choice(COMMENTS)
+        clr     = rng.choice(COLORS)
         w       = 6 * len(comment) + 20
         h       = 20
-        x = random.uniform(100, PAGE_WIDTH - w - 100)
-        y = random.uniform(100, PAGE_HEIGHT - h - 100)
+        x = rng.uniform(100, PAGE_WIDTH - w - 100)
+        y = rng.uniform(100, PAGE_HEIGHT - h - 100)
 
         # box
         c.setStrokeColor(clr)
@@ -75,7 +82,7 @@ def draw_page(page_num, path):
         c.drawString(x + 5, y + 5, comment)
 
         # arrow to a nearby point
-        ex, ey = x + w/2 + random.uniform(-50, 50), y + h/2 + random.uniform(-50, 50)
+        ex, ey = x + w/2 + rng.uniform(-50, 50), y + h/2 + rng.uniform(-50, 50)
         c.setStrokeColor(clr)
         c.setLineWidth(1)
         c.line(x + w/2, y + h/2, ex, ey)
@@ -85,17 +92,53 @@ def draw_page(page_num, path):
     # footer
     c.setFont("Helvetica-Oblique", 10)
     c.drawCentredString(PAGE_WIDTH/2, 30, f"Mockup PDF – Page {page_num}")
-    c.save()
 
-def generate_pages():
+def new_canvas(output, timestamp=None):
+    # With a timestamp, reportlab's invariant mode fixes the document ID and the dates
+    c = canvas.Canvas(output, pagesize=(PAGE_WIDTH, PAGE_HEIGHT),
+                      pageCompression=reportlab_page_compression(COMPRESSION),
+                      invariant=timestamp is not None)
+    if timestamp is not None:
+        c.setDateFormatter(lambda *_: timestamp.strftime("D:%Y%m%d%H%M%S"))
+    return c
+
+def draw_page(page_num, path, rng=random, timestamp=None):
+    c = new_canvas(path, timestamp)
+    draw_page_content(c, page_num, rng)
+    with compression_level(COMPRESSION):
+        c.save()
+
+def write_pages(output, page_nums, seed, timestamp=None):
+    # All pages in one canvas (showPage between pages), written straight to output
+    c = new_canvas(output, timestamp)
+    for page_num in page_nums:
+        draw_page_content(c, page_num, page_rng(seed, page_num))
+        c.showPage()
+    with compression_level(COMPRESSION):
+        c.save()
+
+def _write_pages_task(task):
+    path, page_nums, seed, timestamp = task
+    write_pages(path, page_nums, seed, timestamp)
+    return path
+
+def generate_document(workers=WORKERS, seed=SEED, timestamp=TIMESTAMP):
+    """Write all PAGES into OUTPUT_PDF. Serially this is a single canvas with no
+    temp files; in parallel each worker writes one part file which is then merged."""
+    if seed is None:
+        seed = new_seed()
+    chunks = split_pages(range(1, PAGES+1), resolve_workers(workers))
+    if len(chunks) <= 1:
+        with open(OUTPUT_PDF, "wb") as f:
+            write_pages(f, range(1, PAGES+1), seed, timestamp)
+        print(f" → generated {PAGES} pages into {OUTPUT_PDF}")
+        return
     os.makedirs(TEMP_DIR, exist_ok=True)
-    paths = []
-    for i in range(1, PAGES+1):
-        p = os.path.join(TEMP_DIR, f"page_{i}.pdf")
-        draw_page(i, p)
-        paths.append(p)
+    tasks = [(os.path.join(TEMP_DIR, f"part_{n}.pdf"), chunk, seed, timestamp) for n, chunk in enumerate(chunks)]
+    paths = map_pages(_write_pages_task, tasks, workers)
+    for p in paths:
         print(f" → generated {p}")
-    return paths
+    merge_pages(paths)
 
 def merge_pages(paths):
     merger = PdfMerger()
@@ -111,19 +154,14 @@ def pad_to_target():
     if actual > target_bytes:
         print(f"⚠️  PDF is already {actual//1024**2} MB, which is > target {TARGET_SIZE_MB} MB.")
         return
-    to_pad = target_bytes - actual
-    with open(OUTPUT_PDF, "ab") as f:
-        f.write(b"\0" * to_pad)
-    print(f" → padded with {to_pad} null bytes")
+    to_pad = fill_file(OUTPUT_PDF, target_bytes, PAD_MODE, SEED)
+    print(f" → padded with {to_pad} bytes ({PAD_MODE})")
     final = os.path.getsize(OUTPUT_PDF)
     print(f"✅ Final size: {final/1024**2:.2f} MB")
 
 if __name__ == "__main__":
     print("Generating pages…")
-    page_files = generate_pages()
-
-    print("\nMerging…")
-    merge_pages(page_files)
+    generate_document()
 
     print("\nPadding to exact size…")
     pad_to_target()
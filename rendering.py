@@ -0,0 +1,272 @@
+"""
+Raster background rendering shared by app.py and pdf_markdown_generator.py.
+
+Pages are rendered with PyMuPDF and handed to FPDF as in-memory Pillow images
+built straight from the pixmap samples, so there is no PNG encode / temp file /
+PNG decode round-trip per page.
+
+RenderSettings choose the resolution (dpi), colour space and image encoding:
+'flate' hands FPDF the raw pixels (it deflates them), 'jpeg' encodes them with
+Pillow on a thread pool of RENDER_ENCODE_THREADS while the next page renders.
+
+Rendered pages are cached by (source file digest, page index, render matrix,
+colour space and encoding): an in-process LRU tier bounded by PAGE_CACHE_MB
+and, when PAGE_CACHE_DIR is set, an on-disk tier bounded by PAGE_CACHE_DISK_MB
+that survives restarts and is shared between worker processes.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+from fpdf.image_parsing import preload_image
+from PIL import Image
+
+from cache import LRUCache, DiskCache
+from profiling import NULL_RECORDER
+
+# Pillow image modes for the pixmap component counts PyMuPDF produces
+_PIXMAP_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+# Disk entries are a small header (mode, width, height) followed by raw samples,
+# or by the encoded file for mode 'JPEG'
+_DISK_HEADER = struct.Struct('<4sII')
+
+RENDER_COLORSPACES = {'rgb': fitz.csRGB, 'gray': fitz.csGRAY}
+IMAGE_FORMATS = ('flate', 'jpeg')
+
+# dpi: render resolution (72 = one pixel per point); colorspace: a RENDER_COLORSPACES
+# key; image_format: one of IMAGE_FORMATS; quality: JPEG quality (1-95)
+RenderSettings = namedtuple('RenderSettings', 'dpi colorspace image_format quality')
+DEFAULT_RENDER = RenderSettings(dpi=72, colorspace='rgb', image_format='flate', quality=75)
+
+# Threads encoding JPEG backgrounds for one document
+ENCODE_THREADS = int(os.environ.get('RENDER_ENCODE_THREADS', '0')) or min(4, os.cpu_count() or 1)
+
+
+def pixmap_to_image(pix):
+    """Wrap the raw samples of a fitz.Pixmap in a Pillow image (no re-encoding)."""
+    mode = _PIXMAP_MODES.get(pix.n)
+    if mode is None:
+        raise ValueError(f"Unsupported pixmap with {pix.n} components")
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples_mv)
+
+
+_digest_lock = threading.Lock()
+_digests = {}  # (path, size, mtime_ns) -> sha256 hex digest
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoized on (path, size, mtime)."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digests.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _digest_lock:
+            _digests[memo_key] = digest
+    return digest
+
+
+def document_digest(doc):
+    """Content digest for an open fitz.Document, or None if it was not opened from a file."""
+    name = doc.name
+    if name and os.path.isfile(name):
+        return file_digest(name)
+    return None
+
+
+class PageRenderCache:
+    """Content-addressed cache of rendered background pages."""
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.memory = LRUCache(max_bytes)
+        self.disk = DiskCache(disk_dir, disk_max_bytes) if disk_dir else None
+
+    @staticmethod
+    def make_key(digest, page_index, matrix, variant=''):
+        matrix_key = ','.join(f'{v:g}' for v in tuple(matrix))
+        raw = f'{digest}:{page_index}:{matrix_key}'
+        if variant:
+            raw += f':{variant}'
+        return hashlib.sha256(raw.encode('ascii')).hexdigest()
+
+    def get(self, key):
+        img = self.memory.get(key)
+        if img is not None:
+            return img
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                mode, width, height = _DISK_HEADER.unpack_from(data)
+                if mode == b'JPEG':
+                    img = data[_DISK_HEADER.size:]
+                else:
+                    img = Image.frombytes(mode.rstrip(b' ').decode('ascii'), (width, height),
+                                          memoryview(data)[_DISK_HEADER.size:])
+                self.memory.put(key, img, _image_size(img))
+                return img
+        return None
+
+    def put(self, key, img):
+        self.memory.put(key, img, _image_size(img))
+        if self.disk is not None:
+            if isinstance(img, bytes):
+                self.disk.put(key, _DISK_HEADER.pack(b'JPEG', 0, 0) + img)
+                return
+            header = _DISK_HEADER.pack(img.mode.ljust(4).encode('ascii'), img.width, img.height)
+            self.disk.put(key, header + img.tobytes())
+
+    def clear(self):
+        self.memory.clear()
+
+
+def _image_size(img):
+    if isinstance(img, bytes):
+        return len(img)
+    return img.width * img.height * len(img.getbands())
+
+
+PAGE_CACHE = PageRenderCache(
+    max_bytes=int(float(os.environ.get('PAGE_CACHE_MB', '256')) * 1024 * 1024),
+    disk_dir=os.environ.get('PAGE_CACHE_DIR') or None,
+    disk_max_bytes=int(float(os.environ.get('PAGE_CACHE_DISK_MB', '2048')) * 1024 * 1024),
+)
+
+
+def render_matrix(settings):
+    """Page-to-pixmap matrix for settings.dpi."""
+    zoom = settings.dpi / 72
+    return fitz.Matrix(zoom, zoom)
+
+
+def _cache_variant(settings):
+    # Part of the cache key besides the matrix; empty for RGB pixels, as before
+    parts = [] if settings.colorspace == 'rgb' else [settings.colorspace]
+    if settings.image_format == 'jpeg':
+        parts.append(f'jpeg{settings.quality}')
+    return ':'.join(parts)
+
+
+def encode_image(img, settings):
+    """The background as FPDF gets it: the Pillow image itself for 'flate' (FPDF
+    deflates the pixels), JPEG file bytes for 'jpeg' (embedded as-is, DCTDecode)."""
+    if settings.image_format != 'jpeg':
+        return img
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=settings.quality)
+    return buf.getvalue()
+
+
+def _cache_key(page, digest, cache, settings):
+    if digest is None and cache is not None:
+        digest = document_digest(page.parent)
+    if digest is None or cache is None:
+        return None
+    return PageRenderCache.make_key(digest, page.number, render_matrix(settings), _cache_variant(settings))
+
+
+def _render(page, settings):
+    pix = page.get_pixmap(matrix=render_matrix(settings), colorspace=RENDER_COLORSPACES[settings.colorspace],
+                          alpha=False)
+    return pixmap_to_image(pix)
+
+
+def render_page_image(page, digest=None, cache=PAGE_CACHE, settings=DEFAULT_RENDER):
+    """Render a fitz page and return it as an in-memory image FPDF.image() accepts
+    (see encode_image).
+
+    When the source document has a content digest (pass it, or let it be derived
+    from the document's file) the rendered image is looked up in / stored to cache."""
+    key = _cache_key(page, digest, cache, settings)
+    if key is not None:
+        img = cache.get(key)
+        if img is not None:
+            return img
+    img = encode_image(_render(page, settings), settings)
+    if key is not None:
+        cache.put(key, img)
+    return img
+
+
+class PageBackgrounds:
+    """Rendered backgrounds of the source pages of one FPDF document.
+
+    Pages render one at a time on the calling thread (a fitz.Document must not be
+    shared between threads); JPEG encoding runs on a thread pool, a few pages
+    ahead of the page being drawn. Each source page is embedded once: drawing it
+    again refers to the same FPDF image by name, so it is not loaded, rendered,
+    hashed or embedded a second time."""
+
+    def __init__(self, doc, pnos=(), digest=None, settings=DEFAULT_RENDER, cache=PAGE_CACHE,
+                 threads=ENCODE_THREADS, ahead=4):
+        self.doc = doc
+        self.digest = digest
+        self.settings = settings
+        self.cache = cache
+        self.ahead = ahead
+        self._order = deque(dict.fromkeys(pnos))  # pages still to render, in drawing order
+        self._pending = {}  # source page -> Future of its encoded image
+        self._names = {}  # source page -> FPDF image name
+        self._executor = None
+        if settings.image_format == 'jpeg' and threads > 1:
+            self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='encode')
+
+    def _submit(self, pno):
+        page = self.doc.load_page(pno)
+        key = _cache_key(page, self.digest, self.cache, self.settings)
+        img = self.cache.get(key) if key is not None else None
+        if img is not None:
+            future = Future()
+            future.set_result(img)
+            return future
+        pixels = _render(page, self.settings)
+        if self._executor is None:
+            future = Future()
+            future.set_result(self._encode(pixels, key))
+            return future
+        return self._executor.submit(self._encode, pixels, key)
+
+    def _encode(self, pixels, key):
+        img = encode_image(pixels, self.settings)
+        if key is not None:
+            self.cache.put(key, img)
+        return img
+
+    def _image(self, pno):
+        if pno not in self._pending:
+            if pno in self._order:
+                self._order.remove(pno)
+            self._pending[pno] = self._submit(pno)
+        # Keep the next pages rendering (their encoding overlaps with drawing this one)
+        while self._executor is not None and self._order and len(self._pending) <= self.ahead:
+            nxt = self._order.popleft()
+            self._pending[nxt] = self._submit(nxt)
+        return self._pending.pop(pno).result()
+
+    def draw(self, pdf, pno, width, height, recorder=NULL_RECORDER):
+        """Draw source page pno as a full-size background image on FPDF's current page."""
+        name = self._names.get(pno)
+        if name is None:
+            with recorder.span('render'):
+                img = self._image(pno)
+        with recorder.span('image'):
+            if name is None:
+                # Adds the image to FPDF's cache, keyed by a hash of its content
+                name = self._names[pno] = preload_image(pdf.image_cache, img)[0]
+            pdf.image(name, x=0, y=0, w=width, h=height)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
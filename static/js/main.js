@@ -415,7 +415,9 @@ Structural Support Beam`;
             showAlert('Please enter a file name for the generated PDF.', 'warning');
             return;
         }
-        if (!markdownContent || markdownContent.value.trim() === '') {
+        const commentsFileInput = document.getElementById('commentsFile');
+        const commentsFile = commentsFileInput && commentsFileInput.files.length ? commentsFileInput.files[0] : null;
+        if ((!markdownContent || markdownContent.value.trim() === '') && !commentsFile) {
             showAlert('No annotations entered. The PDF will be generated without bubbles.', 'info');
         }
 
@@ -426,6 +428,25 @@ Structural Support Beam`;
         const pageCountInput = document.getElementById('pageCount');
         formData.append('pageCount', pageCountInput && pageCountInput.value ? pageCountInput.value : '1');
         formData.append('markdown', markdownContent ? markdownContent.value : '');
+        if (commentsFile) {
+            formData.append('commentsFile', commentsFile);
+        }
+        const backgroundSelect = document.getElementById('background');
+        formData.append('background', backgroundSelect && backgroundSelect.value ? backgroundSelect.value : 'raster');
+        const padModeSelect = document.getElementById('padMode');
+        formData.append('padMode', padModeSelect && padModeSelect.value ? padModeSelect.value : 'null');
+        const markupModeSelect = document.getElementById('markupMode');
+        formData.append('markupMode', markupModeSelect && markupModeSelect.value ? markupModeSelect.value : 'drawn');
+        const renderDpiInput = document.getElementById('renderDpi');
+        formData.append('renderDpi', renderDpiInput && renderDpiInput.value ? renderDpiInput.value : '72');
+        const renderColorSelect = document.getElementById('renderColor');
+        formData.append('renderColor', renderColorSelect && renderColorSelect.value ? renderColorSelect.value : 'rgb');
+        const imageFormatSelect = document.getElementById('imageFormat');
+        formData.append('imageFormat', imageFormatSelect && imageFormatSelect.value ? imageFormatSelect.value : 'flate');
+        const pagesInput = document.getElementById('pages');
+        if (pagesInput && pagesInput.value.trim()) {
+            formData.append('pages', pagesInput.value.trim());
+        }
         // Add optional modified date (YYYY-MM-DD)
         const modifiedDateInput = document.getElementById('modifiedDate');
         if (modifiedDateInput && modifiedDateInput.value) {
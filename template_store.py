@@ -0,0 +1,140 @@
+"""
+Content-addressed store of uploaded template PDFs.
+
+A template is uploaded once and saved as <sha256>.pdf in the store directory;
+the hex digest is its id and later requests reference it instead of uploading
+the file again. Parsed fitz.Document handles are kept open for the most
+recently used templates (LRU, max_open handles). PyMuPDF documents are not
+safe to use from several threads at once, so each handle has its own lock and
+is only handed out through open(), which holds it for the duration.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+
+_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+_CHUNK = 1024 * 1024
+
+
+class _Handle:
+    def __init__(self, doc):
+        self.doc = doc
+        self.lock = threading.Lock()
+        self.evicted = False
+
+
+class TemplateStore:
+    def __init__(self, directory, max_open=8):
+        self.directory = directory
+        self.max_open = max_open
+        os.makedirs(directory, exist_ok=True)
+        self._handles = OrderedDict()  # template id -> _Handle, most recently used last
+        self._lock = threading.Lock()
+
+    def path(self, template_id):
+        """Path of a stored template, or None if the id is unknown."""
+        if not _ID_RE.match(template_id or ''):
+            return None
+        path = os.path.join(self.directory, f'{template_id}.pdf')
+        return path if os.path.isfile(path) else None
+
+    def add(self, stream):
+        """Store the PDF read from a binary stream and return its id.
+        Uploading the same content again returns the same id without a second copy.
+        Raises ValueError if the data is not a readable PDF."""
+        h = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(_CHUNK), b''):
+                    h.update(chunk)
+                    f.write(chunk)
+            template_id = h.hexdigest()
+            if self.path(template_id):
+                return template_id
+            try:
+                with fitz.open(tmp_path) as doc:
+                    if not doc.is_pdf or len(doc) == 0:
+                        raise ValueError('not a PDF with pages')
+            except (RuntimeError, ValueError) as e:
+                raise ValueError(f'Invalid PDF: {e}')
+            os.replace(tmp_path, os.path.join(self.directory, f'{template_id}.pdf'))
+            return template_id
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @contextmanager
+    def open(self, template_id):
+        """Yield the warm fitz.Document for a template, holding its lock.
+        Raises KeyError for an unknown id."""
+        while True:
+            handle = self._checkout(template_id)
+            with handle.lock:
+                if handle.doc.is_closed:
+                    continue  # evicted and closed before we got the lock; reopen
+                try:
+                    yield handle.doc
+                finally:
+                    if handle.evicted:
+                        handle.doc.close()
+                return
+
+    def _checkout(self, template_id):
+        with self._lock:
+            handle = self._handles.get(template_id)
+            if handle is not None:
+                self._handles.move_to_end(template_id)
+                return handle
+        path = self.path(template_id)
+        if path is None:
+            raise KeyError(template_id)
+        doc = fitz.open(path)
+        with self._lock:
+            # Another request may have opened it meanwhile; keep the first handle
+            handle = self._handles.get(template_id)
+            if handle is None:
+                handle = self._handles[template_id] = _Handle(doc)
+                doc = None
+            self._handles.move_to_end(template_id)
+            evicted = []
+            while len(self._handles) > self.max_open:
+                evicted.append(self._handles.popitem(last=False)[1])
+        if doc is not None:
+            doc.close()
+        for old in evicted:
+            self._release(old)
+        return handle
+
+    @staticmethod
+    def _release(handle):
+        # Close now if idle, otherwise the current user closes it when done
+        handle.evicted = True
+        if handle.lock.acquire(blocking=False):
+            try:
+                handle.doc.close()
+            finally:
+                handle.lock.release()
+
+    def info(self, template_id):
+        """Page count and size of a stored template, or None if unknown."""
+        path = self.path(template_id)
+        if path is None:
+            return None
+        with self.open(template_id) as doc:
+            pages = len(doc)
+        return {'templateId': template_id, 'pages': pages, 'bytes': os.path.getsize(path)}
+
+    def close(self):
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            self._release(handle)
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from placement import PlacementGrid
+
+WIDTH, HEIGHT, MARGIN = 2592, 1728, 36
+
+
+def overlaps(a, b):
+    return not (a[0] + a[2] <= b[0] or b[0] + b[2] <= a[0] or a[1] + a[3] <= b[1] or b[1] + b[3] <= a[1])
+
+
+def fits_anywhere(boxes, w, h):
+    # A free spot can always be slid up and left until it touches the margin or a
+    # box, so checking those positions against every box is exhaustive
+    xs = [MARGIN] + [b[0] + b[2] for b in boxes]
+    ys = [MARGIN] + [b[1] + b[3] for b in boxes]
+    for y in ys:
+        if y + h > HEIGHT - MARGIN:
+            continue
+        for x in xs:
+            if x + w > WIDTH - MARGIN:
+                continue
+            if not any(overlaps((x, y, w, h), b) for b in boxes):
+                return True
+    return False
+
+
+def random_sizes(rng, n):
+    return [(rng.uniform(180, 300), 16 * rng.randint(1, 4) + 12) for _ in range(n)]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_placed_boxes_do_not_overlap_and_stay_inside(seed):
+    rng = random.Random(seed)
+    grid = PlacementGrid(WIDTH, HEIGHT, MARGIN)
+    for w, h in random_sizes(rng, 600):
+        grid.place(w, h, rng=rng)
+    boxes = grid.boxes
+    assert len(boxes) > 200
+    for i, a in enumerate(boxes):
+        assert MARGIN <= a[0] and a[0] + a[2] <= WIDTH - MARGIN
+        assert MARGIN <= a[1] and a[1] + a[3] <= HEIGHT - MARGIN
+        assert not any(overlaps(a, b) for b in boxes[i + 1:])
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_every_rejected_box_collides(seed):
+    rng = random.Random(seed)
+    grid = PlacementGrid(WIDTH, HEIGHT, MARGIN)
+    rejected = 0
+    for w, h in random_sizes(rng, 600):
+        if grid.place(w, h, rng=rng) is None:
+            rejected += 1
+            assert not fits_anywhere(grid.boxes, w, h), (w, h)
+    assert rejected
+
+
+def test_small_box_fills_gap_left_behind_larger_ones():
+    grid = PlacementGrid(300, 100, 0)
+    grid.insert((0, 0, 100, 100))
+    grid.insert((150, 0, 150, 100))
+    # Only the 50 x 100 gap between the two boxes is left
+    assert grid.place(60, 10, rng=random.Random(0)) is None
+    assert grid.place(50, 100, rng=random.Random(0)) == (100, 0)
@@ -0,0 +1,75 @@
+"""
+Cached text measurement and word wrapping for FPDF overlays.
+
+Each word is measured once per (font, style, size) and lines are built from
+cumulative widths, instead of re-measuring the growing line prefix for every
+word. Wrapped results are memoized by (font, text, width bucket) so the same
+comment text placed again is not wrapped again.
+"""
+
+import threading
+
+from cache import LRUCache
+
+_MAX_WORDS_PER_FONT = 200_000
+
+_lock = threading.Lock()
+_word_widths = {}  # font key -> {word: width}
+_wrapped = LRUCache(max_bytes=16 * 1024 * 1024)
+
+
+def _font_key(pdf_obj):
+    return (pdf_obj.font_family, pdf_obj.font_style, pdf_obj.font_size_pt)
+
+
+def _widths_for(pdf_obj, font_key):
+    with _lock:
+        widths = _word_widths.get(font_key)
+        if widths is None or len(widths) > _MAX_WORDS_PER_FONT:
+            widths = _word_widths[font_key] = {}
+    return widths
+
+
+def wrap_text(pdf_obj, text, max_width):
+    """Split text into lines no wider than max_width in the pdf_obj's current font.
+    A single word wider than max_width is kept on its own line."""
+    font_key = _font_key(pdf_obj)
+    bucket = int(max_width)  # widths are bucketed to whole points (never wider than asked)
+    memo_key = (font_key, bucket, text)
+    lines = _wrapped.get(memo_key)
+    if lines is not None:
+        return list(lines)
+
+    widths = _widths_for(pdf_obj, font_key)
+    space_w = widths.get(' ')
+    if space_w is None:
+        space_w = widths[' '] = pdf_obj.get_string_width(' ')
+
+    lines = []
+    cur_words = []
+    cur_w = 0.0
+    for word in text.split(' '):
+        if not word:
+            continue
+        word_w = widths.get(word)
+        if word_w is None:
+            word_w = widths[word] = pdf_obj.get_string_width(word)
+        if not cur_words:
+            cur_words, cur_w = [word], word_w
+        elif cur_w + space_w + word_w <= bucket:
+            cur_words.append(word)
+            cur_w += space_w + word_w
+        else:
+            lines.append(' '.join(cur_words))
+            cur_words, cur_w = [word], word_w
+    if cur_words:
+        lines.append(' '.join(cur_words))
+
+    _wrapped.put(memo_key, tuple(lines), len(text) * 2 + 64)
+    return lines
+
+
+def clear_caches():
+    with _lock:
+        _word_widths.clear()
+    _wrapped.clear()
@@ -0,0 +1,23 @@
+"""
+wsgi.py
+
+Production entry point. Serve with gunicorn using the settings in
+gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (the default there) this module is imported once in the
+master process: fitz, fpdf2, reportlab and PyPDF2 are imported and the default
+PDF is rendered into the page cache before the workers are forked, so every
+worker starts warm and shares that memory copy-on-write.
+"""
+
+import time
+
+from app import app, warm_up
+
+_start = time.perf_counter()
+_pages = warm_up()
+print(f'Warm-up: {_pages} page(s) of the default PDF cached in {time.perf_counter() - _start:.2f}s')
+
+__all__ = ['app']